@@ -1,17 +1,55 @@
-from sklearn.datasets import load_digits, load_wine
+import functools
+import os
+
+from joblib import parallel_backend
+from sklearn import datasets
 from sklearn.ensemble import AdaBoostClassifier, RandomForestClassifier
 from sklearn.model_selection import cross_val_score
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
 from sklearn.svm import SVC
+from threadpoolctl import threadpool_limits
+import numpy as np
 import pandas as pd
 import logging
 
-from memento import Config, Context, Memento
+from memento import Config, Context, Memento, generate_configurations
 
 logging.basicConfig(level=logging.INFO)
 
 
+# Datasets are loaded once per process and shared between every configuration that uses them.
+@functools.lru_cache(maxsize=None)
+def load_digits():
+    return datasets.load_digits()
+
+
+@functools.lru_cache(maxsize=None)
+def load_wine():
+    return datasets.load_wine()
+
+
+matrix = {
+    "parameters": {
+        "dataset": [load_digits, load_wine],
+        # cross_val_score hands each fold its own copy of the data, so it can be scaled in place
+        "preprocessing": [MinMaxScaler(copy=False), StandardScaler(copy=False)],
+        "classifier": [AdaBoostClassifier, RandomForestClassifier, SVC],
+    },
+    "settings": {
+        "n_fold": 20,
+    },
+    "exclude": [
+        {"dataset": load_digits, "classifier": SVC},
+    ],
+}
+
+# Memento runs one task per core, folds are spread over whatever cores that leaves idle. Memento's
+# workers are daemonic processes which can't start loky workers, so folds use threads instead.
+# BLAS is limited to one thread per fold, so fold threads don't oversubscribe the cores.
+FOLD_JOBS = max(1, (os.cpu_count() or 1) // len(generate_configurations(matrix)))
+
+
 def experiment(context: Context, config: Config):
     data = config.dataset()
     model = config.classifier()
@@ -19,31 +57,23 @@ def experiment(context: Context, config: Config):
     cv = config.settings["n_fold"]
 
     pipeline = make_pipeline(config.preprocessing, model)
-    results = cross_val_score(pipeline, data.data, data.target, cv=cv)
+    with threadpool_limits(limits=1), parallel_backend("threading", n_jobs=FOLD_JOBS):
+        results = cross_val_score(pipeline, data.data, data.target, cv=cv, n_jobs=FOLD_JOBS)
     context.checkpoint(results)
     return results.mean() * 100
 
 
 def resultsToTable(results):
-    res = [[round(r.inner, 2), r.config.dataset.__name__, r.config.preprocessing.__class__.__name__,
-            r.config.classifier.__name__] for r in results]
-    return pd.DataFrame(res, columns=['Accuracy', 'Dataset', 'Preprocessing', 'Classifier'])
+    # One list per column lets pandas build each column without per-cell type inference
+    return pd.DataFrame({
+        'Accuracy': np.round([r.inner for r in results], 2),
+        'Dataset': [r.config.dataset.__name__ for r in results],
+        'Preprocessing': [r.config.preprocessing.__class__.__name__ for r in results],
+        'Classifier': [r.config.classifier.__name__ for r in results],
+    })
 
 
 def main():
-    matrix = {
-        "parameters": {
-            "dataset": [load_digits, load_wine],
-            "preprocessing": [MinMaxScaler(), StandardScaler()],
-            "classifier": [AdaBoostClassifier, RandomForestClassifier, SVC],
-        },
-        "settings": {
-            "n_fold": 20,
-        },
-        "exclude": [
-            {"dataset": load_digits, "classifier": SVC},
-        ],
-    }
     Memento(experiment).run(matrix, dry_run=True)
     results = Memento(experiment).run(matrix)
     return results
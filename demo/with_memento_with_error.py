@@ -3,8 +3,10 @@ This code demonstrates the scenario where 1 task in MEMENTO encounters an error.
 Created by: Zac Pullar-Strecker, 2022
 """
 import functools
+import os
 from pprint import pprint
 
+from joblib import parallel_backend
 from sklearn import datasets
 from sklearn.ensemble import (
     AdaBoostClassifier,
@@ -14,10 +16,28 @@ from sklearn.ensemble import (
 from sklearn.model_selection import cross_val_score
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
+from threadpoolctl import threadpool_limits
 
-from memento import Memento, Config, Context
+from memento import Memento, Config, Context, generate_configurations
 
 
+# Datasets are loaded once per process and shared between every configuration that uses them.
+@functools.lru_cache(maxsize=None)
+def load_iris(**kwargs):
+    return datasets.load_iris(**kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def load_digits(**kwargs):
+    return datasets.load_digits(**kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def load_breast_cancer(**kwargs):
+    return datasets.load_breast_cancer(**kwargs)
+
+
+@functools.lru_cache(maxsize=None)
 def load_wine_broken():
     wine_x, wine_y = datasets.load_wine(return_X_y=True)
     wine_y_broken = wine_y[:-1]
@@ -34,14 +54,19 @@ matrix = {
             SVC,
         ],
         "dataset": [
-            functools.partial(datasets.load_iris, return_X_y=True),
-            functools.partial(datasets.load_digits, return_X_y=True),
+            functools.partial(load_iris, return_X_y=True),
+            functools.partial(load_digits, return_X_y=True),
             load_wine_broken,
-            functools.partial(datasets.load_breast_cancer, return_X_y=True),
+            functools.partial(load_breast_cancer, return_X_y=True),
         ],
     }
 }
 
+# Memento runs one task per core, folds are spread over whatever cores that leaves idle. Memento's
+# workers are daemonic processes which can't start loky workers, so folds use threads instead.
+# BLAS is limited to one thread per fold, so fold threads don't oversubscribe the cores.
+FOLD_JOBS = max(1, (os.cpu_count() or 1) // len(generate_configurations(matrix)))
+
 
 def experiment(context: Context, config: Config):
     classifier = config.classifier()
@@ -50,7 +75,8 @@ def experiment(context: Context, config: Config):
     if context.checkpoint_exist():
         scores = context.restore()
     else:
-        scores = cross_val_score(classifier, x, y, cv=10)
+        with threadpool_limits(limits=1), parallel_backend("threading", n_jobs=FOLD_JOBS):
+            scores = cross_val_score(classifier, x, y, cv=10, n_jobs=FOLD_JOBS)
         context.checkpoint(scores)
 
     return scores.mean()
@@ -11,6 +11,7 @@ from memento.notifications import (
     ConsoleNotificationProvider,
     FileSystemNotificationProvider,
     EmailNotificationProvider,
+    BatchEmailNotificationProvider,
     SmtpConfiguration,
 )
 from memento.caching import (
@@ -19,6 +20,7 @@ from memento.caching import (
     FileSystemCacheProvider,
     Cache,
     default_key_provider,
+    memory_key_provider,
 )
 from memento.parallel import (
     TaskManager,
@@ -27,7 +29,12 @@ from memento.parallel import (
     TASK_PRIORITY_MEDIUM,
     TASK_PRIORITY_HIGH,
 )
-from memento.exceptions import AggregateException, CacheMiss, CyclicDependency
+from memento.exceptions import (
+    AggregateException,
+    CacheMiss,
+    CyclicDependency,
+    RemoteTaskError,
+)
 
 __all__ = [
     "Memento",
@@ -44,12 +51,14 @@ __all__ = [
     "ConsoleNotificationProvider",
     "FileSystemNotificationProvider",
     "EmailNotificationProvider",
+    "BatchEmailNotificationProvider",
     "SmtpConfiguration",
     "CacheProvider",
     "MemoryCacheProvider",
     "FileSystemCacheProvider",
     "Cache",
     "default_key_provider",
+    "memory_key_provider",
     "TaskManager",
     "delayed",
     "TASK_PRIORITY_LOW",
@@ -58,6 +67,7 @@ __all__ = [
     "AggregateException",
     "CacheMiss",
     "CyclicDependency",
+    "RemoteTaskError",
 ]
 
 __version__ = "1.2.0"
@@ -2,13 +2,72 @@
 Contains classes for implementing caching of functions.
 """
 import os
+import pickle
 import sqlite3
 import hashlib
+import io
+import struct
+import sys
 import tempfile
+import threading
+import types
+import weakref
 from abc import ABC, abstractmethod
-from typing import Callable
+from collections import OrderedDict
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 import cloudpickle
 
+# Cache and checkpoint keys. The default key providers make 16 byte digests.
+Key = Union[str, bytes]
+
+# Marks cache files written by ``_dump_item``. Files without it are plain cloudpickle files.
+_FILE_MAGIC = b"MEMENTO\x05"
+_FILE_HEADER = struct.Struct("<QQ")
+_BUFFER_LENGTH = struct.Struct("<Q")
+# Magic string at the start of ``.npy`` files, used for cached numpy arrays
+_NPY_MAGIC = b"\x93NUMPY"
+
+# (filepath, table name) of databases set up by this process, see
+# ``FileSystemCacheProvider._setup_database``
+_SETUP_DATABASES: Set[Tuple[str, str]] = set()
+_SETUP_LOCK = threading.Lock()
+
+# Keys bound per statement by the ``*_many`` methods, well under SQLite's default limit of 999
+_SQLITE_BATCH_SIZE = 900
+
+
+def _database_path(filepath: Optional[str], suffix: str) -> str:
+    """
+    Returns the absolute path of a database file. Without a filepath, a new temporary file with
+    the given suffix is created and used. SQLite treats the empty file as a new database.
+    """
+    if not filepath:
+        descriptor, path = tempfile.mkstemp(suffix=suffix)
+        os.close(descriptor)
+        return path
+    return filepath if os.path.isabs(filepath) else os.path.abspath(filepath)
+
+
+def _batches(items: Sequence, size: int = _SQLITE_BATCH_SIZE) -> Iterator[Sequence]:
+    """
+    Splits a sequence into consecutive batches of at most ``size`` items.
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
 
 class CacheProvider(ABC):
     """
@@ -22,13 +81,13 @@ class CacheProvider(ABC):
         class CustomCacheProvider(CacheProvider):
     """
 
-    def __getitem__(self, key: str):
+    def __getitem__(self, key: Key):
         return self.get(key)
 
-    def __setitem__(self, key: str, item):
+    def __setitem__(self, key: Key, item):
         return self.set(key, item)
 
-    def __contains__(self, key: str):
+    def __contains__(self, key: Key):
         return self.contains(key)
 
     @abstractmethod
@@ -40,7 +99,7 @@ class CacheProvider(ABC):
         """
 
     @abstractmethod
-    def get(self, key: str):
+    def get(self, key: Key):
         """
         Gets the item in the cache specified by the key.
 
@@ -50,7 +109,7 @@ class CacheProvider(ABC):
         """
 
     @abstractmethod
-    def set(self, key: str, item) -> None:
+    def set(self, key: Key, item) -> None:
         """
         Puts the item in the cache, at the specified key.
 
@@ -60,16 +119,18 @@ class CacheProvider(ABC):
         """
 
     @abstractmethod
-    def contains(self, key: str) -> bool:
+    def contains(self, key: Key) -> bool:
         """
-        Checks whether a key is already in the cache.
+        Checks whether a key is already in the cache. ``Cache`` only gets items from the cache
+        when this returns True, so it has to be True for every stored item, including ones
+        like ``None`` or ``False``.
 
         :param key: The key to check.
         :returns: True if it exists, False otherwise.
         """
 
     @abstractmethod
-    def make_key(self, func: Callable, *args, **kwargs) -> str:
+    def make_key(self, func: Callable, *args, **kwargs) -> Key:
         """
         Generates a key to be used in caching.
 
@@ -79,10 +140,30 @@ class CacheProvider(ABC):
         :returns: True if it exists, False otherwise.
         """
 
+    def contains_many(self, keys: Sequence) -> Set:
+        """
+        Checks which of the given keys are already in the cache.
+
+        :param keys: The keys to check.
+        :returns: The set of keys that are in the cache.
+        """
+        return {key for key in keys if self.contains(key)}
+
+    def get_many(self, keys: Sequence) -> List:
+        """
+        Gets the items in the cache specified by the keys.
+
+        :param keys: Used to get the items from the cache.
+        :returns: The items in the cache, in the same order as the keys.
+        :raise KeyError: When a key is not in the cache.
+        """
+        return [self.get(key) for key in keys]
+
 
 class MemoryCacheProvider(CacheProvider):
     """
-    An in-memory cache provider. Uses a dictionary for underlying storage.
+    An in-memory cache provider. Uses a dictionary for underlying storage. Items are stored by
+    reference, so nothing is pickled.
     """
 
     def __init__(self, initial_cache: dict = None, key_provider: Callable = None):
@@ -90,24 +171,25 @@ class MemoryCacheProvider(CacheProvider):
         Creates a cache provider that uses memory for caching.
 
         :param initial_cache: Optional initial cache, defaults to an empty dictionary.
+        :param key_provider: Optional key function, defaults to ``memory_key_provider``.
         """
         self._cache = initial_cache or {}
 
-        self._key_provider = key_provider or default_key_provider
+        self._key_provider = key_provider or memory_key_provider
 
     def __str__(self):
         return str(self._cache)
 
-    def get(self, key: str):
+    def get(self, key: Key):
         return self._cache[key]
 
-    def set(self, key: str, item) -> None:
+    def set(self, key: Key, item) -> None:
         self._cache[key] = item
 
-    def contains(self, key: str) -> bool:
-        return self._cache.get(key, False) is not False
+    def contains(self, key: Key) -> bool:
+        return key in self._cache
 
-    def make_key(self, func: Callable, *args, **kwargs) -> str:
+    def make_key(self, func: Callable, *args, **kwargs) -> Key:
         return self._key_provider(func, *args, **kwargs)
 
 
@@ -130,13 +212,14 @@ class FileSystemCacheProvider(CacheProvider):
         """
         self._connection = connection  # if none is handled elsewhere
         # use a temporary file (in appropriate tmp dir) if no file provided
-        self._filepath = os.path.abspath(
-            filepath or tempfile.NamedTemporaryFile(suffix="_memento.cache").name
-        )
+        self._filepath = _database_path(filepath, "_memento.cache")
+        # Temporary databases are never shared, so there's no point remembering their setup
+        self._remember_setup = connection is None and filepath is not None
         self._table_name = table_name or "cache"
 
         self._sqlite_timestamp = "(julianday('now') - 2440587.5)*86400.0"
         self._sql_select = f"SELECT value FROM {self._table_name} WHERE key = ?"
+        self._sql_exists = f"SELECT 1 FROM {self._table_name} WHERE key = ? LIMIT 1"
         self._sql_insert = (
             f"INSERT OR REPLACE INTO {self._table_name}(key,value) VALUES(?,?)"
         )
@@ -144,8 +227,45 @@ class FileSystemCacheProvider(CacheProvider):
 
         self._key_provider = key_provider or default_key_provider
 
+        # Connections are opened lazily and reused, one per thread
+        self._local = threading.local()
+
         self._setup_database()
 
+    def __getstate__(self):
+        # Connections can't be pickled, the unpickled provider opens its own.
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        Gets this thread's connection to the database, creating it on first use.
+
+        :return: A sqlite3 Connection object, representing a database connection.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self._filepath,
+                isolation_level="DEFERRED",
+                timeout=10,
+                check_same_thread=False,
+            )
+            # page_size only applies to a new database and must be set before enabling WAL
+            connection.execute("PRAGMA page_size=16384")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA temp_store=MEMORY")
+            connection.execute("PRAGMA cache_size=-20000")
+            connection.execute("PRAGMA mmap_size=268435456")
+            self._local.connection = connection
+        return connection
+
     def _setup_database(self) -> None:
         """
         Sets up the database, creating a "cache" table, with a key, value, and timestamp column.
@@ -155,7 +275,29 @@ class FileSystemCacheProvider(CacheProvider):
             os.mkdir(self._cache_files_folder)
         except FileExistsError:
             pass
+
+        if not self._remember_setup:
+            self._create_table()
+            return
+
+        setup_key = (self._filepath, self._table_name)
+        with _SETUP_LOCK:
+            # The file is checked too, in case the database was deleted since it was set up
+            if setup_key in _SETUP_DATABASES and os.path.exists(self._filepath):
+                return
+            self._create_table()
+            _SETUP_DATABASES.add(setup_key)
+
+    def _create_table(self) -> None:
+        """
+        Creates the cache table if it doesn't exist.
+        :return: Nothing.
+        """
         with self as database:
+            # Keys produced by ``default_key_provider`` are fixed-size 16 byte digests, so the
+            # primary key index stays compact regardless of the size of the cached arguments.
+            # Values are paths to the cached files, so rows are small enough to keep in the
+            # primary key's B-tree (``WITHOUT ROWID``).
             database.execute(
                 f"""
                 CREATE TABLE IF NOT EXISTS {self._table_name} (
@@ -177,9 +319,7 @@ class FileSystemCacheProvider(CacheProvider):
 
         :return: A sqlite3 Connection object, representing a database connection.
         """
-        return self._connection or sqlite3.Connection(
-            self._filepath, isolation_level="DEFERRED", timeout=10
-        )
+        return self._connection or self._get_connection()
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         """
@@ -194,38 +334,197 @@ class FileSystemCacheProvider(CacheProvider):
     def __str__(self) -> str:
         return f"Filesystem cache, using {self._connection or self._filepath}"
 
-    def get(self, key: str):
+    def get(self, key: Key):
         with self as database:
-            rows = database.execute(self._sql_select, (key,)).fetchall()
-            if rows:
-                with open(rows[0][0], "rb") as pkl_file:
-                    data = cloudpickle.load(pkl_file)
+            # Keys are unique, so there is at most one row
+            row = database.execute(self._sql_select, (key,)).fetchone()
+            if row is not None:
+                with open(row[0], "rb") as pkl_file:
+                    data = _load_item(pkl_file)
                 return data
 
-            raise KeyError(f"Key '{key}' not in cache")
+            raise KeyError(f"Key {key!r} not in cache")
+
+    def set(self, key: Key, item) -> None:
+        path = self._write_item(key, item)
+        with self as database:
+            database.execute(self._sql_insert, (key, path))
+            database.commit()
+
+    def set_many(self, items: Iterable[Tuple[str, object]]) -> None:
+        """
+        Puts many items in the cache at once, using a single transaction.
+
+        :param items: ``(key, item)`` pairs to put in the cache.
+        :returns: Nothing.
+        """
+        rows = [(key, self._write_item(key, item)) for key, item in items]
+        with self as database:
+            database.executemany(self._sql_insert, rows)
+            database.commit()
+
+    def get_many(self, keys: Sequence) -> List:
+        paths: Dict[Hashable, str] = {}
+        with self as database:
+            for batch in _batches(keys):
+                paths.update(
+                    database.execute(self._sql_select_many(len(batch)), batch).fetchall()
+                )
+
+        items = []
+        for key in keys:
+            if key not in paths:
+                raise KeyError(f"Key {key!r} not in cache")
+            with open(paths[key], "rb") as pkl_file:
+                items.append(_load_item(pkl_file))
+        return items
+
+    def _write_item(self, key: Key, item) -> str:
+        """
+        Writes a cached item to its file.
 
-    def set(self, key: str, item) -> None:
+        :return: The path of the file the item was written to.
+        """
         bytes_key = str(key)
         file_name = hashlib.sha256(bytes(bytes_key, "utf-8")).hexdigest()
 
         path = f"{self._cache_files_folder}/{file_name}.pkl"
         with open(path, "wb") as pkl_file:
-            cloudpickle.dump(item, pkl_file)
+            _dump_item(item, pkl_file)
+        return path
+
+    def contains(self, key: Key) -> bool:
         with self as database:
-            database.execute(self._sql_insert, (key, path))
-            database.commit()
+            return database.execute(self._sql_exists, (key,)).fetchone() is not None
 
-    def contains(self, key: str) -> bool:
-        try:
-            self.get(key)
-            return True
-        except KeyError:
-            return False
+    def contains_many(self, keys: Sequence) -> Set:
+        found: Set[Hashable] = set()
+        with self as database:
+            for batch in _batches(keys):
+                rows = database.execute(self._sql_select_many(len(batch), "key"), batch)
+                found.update(row[0] for row in rows)
+        return found
+
+    def _sql_select_many(self, count: int, columns: str = "key, value") -> str:
+        """
+        Creates a query selecting the rows of ``count`` keys.
+        """
+        placeholders = ", ".join("?" * count)
+        return f"SELECT {columns} FROM {self._table_name} WHERE key IN ({placeholders})"
 
-    def make_key(self, func: Callable, *args, **kwargs) -> str:
+    def make_key(self, func: Callable, *args, **kwargs) -> Key:
         return self._key_provider(func, *args, **kwargs)
 
 
+def _dump_item(item, file: IO[bytes]) -> None:
+    """
+    Writes an item to a cache file. Numpy arrays are written in ``.npy`` format. Anything else is
+    pickled with protocol 5 so large buffers (e.g. arrays inside the item) are written
+    out-of-band, straight from their memory, rather than being copied into the pickle first.
+    """
+    # If numpy was never imported, the item can't be an array. Subclasses (e.g. masked arrays)
+    # would lose their type in ``.npy``, so only exact arrays without objects are saved this way.
+    numpy = sys.modules.get("numpy")
+    # pylint: disable-next=unidiomatic-typecheck
+    if numpy is not None and type(item) is numpy.ndarray and not item.dtype.hasobject:
+        # Plain arrays are stored in numpy's own format, which has less overhead than a pickle
+        numpy.save(file, item, allow_pickle=False)
+        return
+
+    data, buffers = _pickle_item(item)
+    raw_buffers = [buffer.raw() for buffer in buffers]
+
+    file.write(_FILE_MAGIC)
+    file.write(_FILE_HEADER.pack(len(data), len(raw_buffers)))
+    for raw in raw_buffers:
+        file.write(_BUFFER_LENGTH.pack(raw.nbytes))
+    file.write(data)
+    for raw in raw_buffers:
+        file.write(raw)
+
+
+def _pickle_item(item) -> Tuple[bytes, List[pickle.PickleBuffer]]:
+    """
+    Pickles an item with protocol 5, returning the pickle and its out-of-band buffers.
+
+    pickle is tried first, since it's much faster than cloudpickle. It stores functions and
+    classes by reference, so items that reference ``__main__`` (or that pickle can't handle at
+    all, like lambdas) are pickled with cloudpickle instead, which can store them by value.
+    Searching the pickle for ``__main__`` can match unrelated data, which only costs speed.
+    """
+    buffers: List[pickle.PickleBuffer] = []
+    try:
+        data = pickle.dumps(item, protocol=5, buffer_callback=buffers.append)
+        if b"__main__" not in data:
+            return data, buffers
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+    buffers = []
+    data = cloudpickle.dumps(item, protocol=5, buffer_callback=buffers.append)
+    return data, buffers
+
+
+def _load_item(file: IO[bytes]):
+    """
+    Reads an item written by ``_dump_item``, or a plain cloudpickle file.
+    """
+    magic = file.read(len(_NPY_MAGIC))
+    file.seek(0)
+    if magic == _NPY_MAGIC:
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        return numpy.load(file, allow_pickle=False)
+
+    content = bytearray(os.fstat(file.fileno()).st_size)
+    file.readinto(content)  # type: ignore
+    return _loads_item(content)
+
+
+def _dumps_item(item) -> bytes:
+    """
+    Serializes an item in the same format ``_dump_item`` writes to files.
+    """
+    file = io.BytesIO()
+    _dump_item(item, file)
+    return file.getvalue()
+
+
+def _loads_item(content: bytearray):
+    """
+    Deserializes an item written by ``_dump_item`` or ``_dumps_item``, or a plain cloudpickle.
+    Out-of-band buffers are restored as views of ``content``, which must be writable so that
+    arrays restored from them are too.
+    """
+    if content.startswith(_NPY_MAGIC):
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        return numpy.load(io.BytesIO(content), allow_pickle=False)
+
+    view = memoryview(content)
+
+    if not content.startswith(_FILE_MAGIC):
+        return pickle.loads(content)
+
+    offset = len(_FILE_MAGIC)
+    data_length, buffer_count = _FILE_HEADER.unpack_from(view, offset)
+    offset += _FILE_HEADER.size
+    lengths = []
+    for _ in range(buffer_count):
+        lengths.append(_BUFFER_LENGTH.unpack_from(view, offset)[0])
+        offset += _BUFFER_LENGTH.size
+
+    data = view[offset : offset + data_length]
+    offset += data_length
+    buffers = []
+    for length in lengths:
+        # Slices of a bytearray are writable, so arrays restored from them are too
+        buffers.append(view[offset : offset + length])
+        offset += length
+
+    return pickle.loads(data, buffers=buffers)
+
+
 class Cache:
     """
     A higher order function that caches another, underlying function.
@@ -276,16 +575,15 @@ class Cache:
         """
         key = self._cache_provider.make_key(self._func, *args, **kwargs)
 
-        try:
-            if force_run:
-                raise KeyError("cache ignored due to force_run")
+        if not force_run and self._cache_provider.contains(key):
             return self._cache_provider.get(key)
-        except KeyError as ex:
-            if force_cache:
-                raise ex
-            value = self._func(*args, **kwargs)  # execute the function, with arguments
-            self._cache_provider.set(key, value)
-            return value
+
+        if force_cache:
+            raise KeyError(f"Key {key!r} not in cache")
+
+        value = self._func(*args, **kwargs)  # execute the function, with arguments
+        self._cache_provider.set(key, value)
+        return value
 
     def __str__(self):
         """
@@ -296,8 +594,150 @@ class Cache:
         return f"Cached function object: func: {self._func}, cache: {str(self._cache_provider)}"
 
 
-def default_key_provider(func: Callable, *args, **kwargs) -> str:
+class _HashWriter:
+    """
+    File-like object that feeds everything written to it into a hash, so pickled data can be
+    hashed without materializing the serialized bytes.
+    """
+
+    def __init__(self, hasher):
+        self._hasher = hasher
+
+    def write(self, data) -> None:
+        """Updates the underlying hash with ``data``."""
+        self._hasher.update(data)
+
+
+def _hash_pickle(obj, prefix: bytes = b"") -> bytes:
+    """
+    Returns a 16 byte BLAKE2b digest of ``prefix`` followed by the cloudpickled object.
+    """
+    hasher = hashlib.blake2b(prefix, digest_size=16)
+    cloudpickle.CloudPickler(_HashWriter(hasher), protocol=5).dump(obj)
+    return hasher.digest()
+
+
+# Fingerprints of plain functions, which hash by identity. Other callables (partials, bound
+# methods, callable objects) may define equality differently so they are fingerprinted each time.
+_FINGERPRINTS: "weakref.WeakKeyDictionary[Callable, bytes]" = weakref.WeakKeyDictionary()
+
+
+def _function_fingerprint(func: Callable) -> bytes:
+    """
+    Returns a 16 byte BLAKE2b digest of the cloudpickled function. For plain functions this is
+    computed once per function object, so later changes to globals they reference are not
+    picked up.
+    """
+    if not isinstance(func, types.FunctionType):
+        return _hash_pickle(func)
+
+    fingerprint = _FINGERPRINTS.get(func)
+    if fingerprint is None:
+        fingerprint = _FINGERPRINTS[func] = _hash_pickle(func)
+    return fingerprint
+
+
+# Least recently used keys for calls of plain functions with immutable arguments, see
+# ``default_key_provider``. They're indexed by the function's fingerprint rather than the
+# function, so remembered keys don't keep functions alive.
+_KEYS: "OrderedDict[Hashable, bytes]" = OrderedDict()
+_MAX_KEYS = 1024
+_KEYS_LOCK = threading.Lock()
+
+
+def _immutable_signature(value) -> Optional[Hashable]:
+    """
+    Returns a hashable value that is equal for two values only if they pickle the same, or None
+    if the value might be mutable. Types are included as ``1``, ``1.0`` and ``True`` are equal
+    but pickle differently, floats are compared by their hex form so ``0.0`` and ``-0.0`` differ.
     """
-    Default cache key function. This uses cloudpickle to hash the function and all arguments.
+    value_type = type(value)
+    if value_type is float:
+        return value.hex()
+    if value_type in (str, int, bool, bytes) or value is None:
+        return value_type, value
+    if value_type is tuple:
+        signature = tuple(_immutable_signature(item) for item in value)
+        return None if None in signature else (tuple, signature)
+    return None
+
+
+def default_key_provider(func: Callable, *args, **kwargs) -> bytes:
+    """
+    Default cache key function. This combines a fingerprint of the function with the cloudpickled
+    arguments and returns a 16 byte BLAKE2b digest of the result.
+
+    Immutable arguments (strings, numbers, bytes, None and tuples of them) are pickled with
+    pickle instead of cloudpickle, which gives the same bytes faster. Keys for plain functions
+    called with them are also remembered, so repeated calls don't pickle the arguments again.
     """
-    return cloudpickle.dumps({"function": func, "args": args, "kwargs": kwargs})
+    fingerprint = _function_fingerprint(func)
+    signature = None
+    if isinstance(func, types.FunctionType):
+        # kwargs are pickled as a dict, so their order is part of the key
+        signature = _immutable_signature((args, tuple(kwargs.items())))
+        if signature is not None:
+            with _KEYS_LOCK:
+                key = _KEYS.get((fingerprint, signature))
+                if key is not None:
+                    _KEYS.move_to_end((fingerprint, signature))
+                    return key
+
+    arguments = {"args": args, "kwargs": kwargs}
+    if signature is None:
+        return _hash_pickle(arguments, prefix=fingerprint)
+
+    # cloudpickle only differs from pickle for code and classes, so immutable arguments are
+    # pickled with the faster pickle, giving the same key
+    key = hashlib.blake2b(
+        fingerprint + pickle.dumps(arguments, protocol=5), digest_size=16
+    ).digest()
+    with _KEYS_LOCK:
+        _KEYS[(fingerprint, signature)] = key
+        if len(_KEYS) > _MAX_KEYS:
+            _KEYS.popitem(last=False)
+    return key
+
+
+# Hashable types whose equal instances can hold items of different types
+_CONTAINERS = (tuple, frozenset)
+
+
+def _float_hex(value):
+    """
+    Returns the hex form of floats, which, unlike the floats, is equal for equal NaNs and differs
+    for ``0.0`` and ``-0.0``. Other values are returned unchanged.
+    """
+    return value.hex() if type(value) is float else value  # pylint: disable=C0123
+
+
+def memory_key_provider(func: Callable, *args, **kwargs) -> Hashable:
+    """
+    Default key function for ``MemoryCacheProvider``. Keys only need to be valid within the
+    current process, so when all arguments are hashable the key is a tuple of the function,
+    the arguments and their types (as in ``functools.lru_cache(typed=True)``) and nothing is
+    pickled. Otherwise this falls back to ``default_key_provider``, as it does for arguments
+    that are containers: only the top level types are part of the key, so ``(1,)`` and
+    ``(1.0,)`` would share one.
+
+    Floats are keyed by their hex form, as in ``default_key_provider``, so ``0.0`` and ``-0.0``
+    get different keys and NaN arguments can be found in the cache.
+    """
+    kwargs_items = tuple(sorted(kwargs.items()))
+    if any(isinstance(arg, _CONTAINERS) for arg in args) or any(
+        isinstance(value, _CONTAINERS) for _, value in kwargs_items
+    ):
+        return default_key_provider(func, *args, **kwargs)
+
+    key = (
+        func,
+        tuple(_float_hex(arg) for arg in args),
+        tuple((name, _float_hex(value)) for name, value in kwargs_items),
+        tuple(type(arg) for arg in args),
+        tuple(type(value) for _, value in kwargs_items),
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return default_key_provider(func, *args, **kwargs)
+    return key
@@ -3,6 +3,8 @@ Contains MEMENTO's configuration generator and ``Configuration``, ``Config`` typ
 """
 
 import itertools
+import operator
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 
 def generate_configurations(matrix: dict) -> "Configurations":
@@ -25,18 +27,35 @@ def generate_configurations(matrix: dict) -> "Configurations":
     settings = matrix.get("settings", {})
     exclude = matrix.get("exclude", [])
 
-    # Generate the cartesian product of all parameters
-    elements = itertools.product(*parameters.values())
-    configs = [Config(**dict(zip(parameters.keys(), element))) for element in elements]
+    # The product and exclude rules are built now so later changes to the matrix don't affect
+    # configurations that haven't been generated yet
+    names = tuple(parameters.keys())
+    exclusions = _Exclusions(exclude, names)
+    product = itertools.product(
+        *(
+            exclusions.allowed_values(index, values)
+            for index, values in enumerate(parameters.values())
+        )
+    )
 
-    idx_exclude = set()
-    for ex in exclude:
-        for i, config in enumerate(configs):
-            if all(getattr(config, k, _Never) == v for (k, v) in ex.items()):
-                idx_exclude.add(i)
-    configs = [j for i, j in enumerate(configs) if i not in idx_exclude]
+    return Configurations(_generate(names, product, exclusions), settings)
 
-    return Configurations(configs, settings)
+
+def _generate(
+    names: Tuple[str, ...], product: Iterator[tuple], exclusions: "_Exclusions"
+) -> Iterator["Config"]:
+    """
+    Lazily generates configurations from the cartesian product of all parameters, dropping
+    excluded combinations before a ``Config`` is ever created for them.
+    """
+    if not exclusions:
+        for element in product:
+            yield Config(**dict(zip(names, element)))
+        return
+
+    for element in product:
+        if not exclusions.matches(element):
+            yield Config(**dict(zip(names, element)))
 
 
 class Configurations:
@@ -44,26 +63,62 @@ class Configurations:
     Holds all generated experiment configurations.
 
     Global settings can be accessed via `configurations.settings`.
+
+    Configurations may be given as an iterator, in which case they are only generated as they
+    are first accessed and kept for later accesses. ``len`` generates all of them.
     """
 
-    def __init__(self, configs, settings):
-        self.configurations = configs
+    def __init__(self, configs: Iterable["Config"], settings):
+        self._configurations: List[Config] = []
+        self._pending: Optional[Iterator[Config]] = iter(configs)
         self.settings = settings
 
-        # Create back-references
-        for config in self.configurations:
-            config.settings = settings
+    @property
+    def configurations(self) -> List["Config"]:
+        """
+        All configurations, as a list.
+        """
+        self._realize(None)
+        return self._configurations
+
+    def _realize(self, count: Optional[int]) -> None:
+        """
+        Generates configurations until at least ``count`` exist, or all of them if ``None``.
+        """
+        while self._pending is not None and (
+            count is None or len(self._configurations) < count
+        ):
+            config = next(self._pending, None)
+            if config is None:
+                self._pending = None
+                break
+            # Create back-reference
+            config.settings = self.settings
+            self._configurations.append(config)
 
     def __len__(self):
         return self.configurations.__len__()
 
     def __iter__(self):
-        return self.configurations.__iter__()
+        index = 0
+        while True:
+            self._realize(index + 1)
+            if index >= len(self._configurations):
+                return
+            yield self._configurations[index]
+            index += 1
 
     def __getitem__(self, index):
+        if isinstance(index, int) and index >= 0:
+            self._realize(index + 1)
+            return self._configurations.__getitem__(index)
         return self.configurations.__getitem__(index)
 
 
+# Attributes ``Config`` sets on its instances, which parameters mustn't overwrite
+_INSTANCE_ATTRIBUTES = frozenset({"_dict", "_hash", "settings"})
+
+
 class Config:
     """
     A single experiment configuration. Parameters are set as attributes.
@@ -71,6 +126,10 @@ class Config:
     Global settings can also be accessed via `config.settings`.
     """
 
+    _dict: Dict[str, Any]
+    # Set by ``Configurations`` when the config is generated
+    settings: Any
+
     def __new__(cls, *args, **kwargs):  # pylint: disable=W0613
         self = super(Config, cls).__new__(cls)
         # This is required to establish the invariant that `_dict` is always defined.
@@ -81,8 +140,18 @@ class Config:
 
     def __init__(self, **kwargs):
         self._dict = kwargs
+        # Parameters are also set as instance attributes so accessing them doesn't go through
+        # ``__getattr__``. Names that clash with the class' own attributes, or with attributes
+        # it sets on instances, are left to it.
+        cls = type(self)
+        self.__dict__.update(
+            (name, value)
+            for name, value in kwargs.items()
+            if name not in _INSTANCE_ATTRIBUTES and not hasattr(cls, name)
+        )
 
     def __getattr__(self, name):
+        # Only reached for names that aren't instance attributes
         try:
             return self._dict[name]
         except KeyError:
@@ -105,10 +174,32 @@ class Config:
     def __repr__(self):
         return self._dict.__repr__()
 
+    def __getstate__(self):
+        # The cached hash depends on the process' hash seed so it isn't pickled
+        state = self.__dict__.copy()
+        state.pop("_hash", None)
+        return state
+
     def __eq__(self, obj: object) -> bool:
+        if self is obj:
+            return True
         if not isinstance(obj, type(self)):
             return False
-        return self._dict == obj._dict and self.settings == obj.settings
+        return _dicts_equal(self._dict, obj._dict) and _dicts_equal(
+            self.__dict__.get("settings"), obj.__dict__.get("settings")
+        )
+
+    def __hash__(self) -> int:
+        try:
+            return self.__dict__["_hash"]
+        except KeyError:
+            pass
+        # Settings are shared by every config of a matrix, so they're left out of the hash
+        value = hash(
+            tuple(sorted((name, _hashable(v)) for name, v in self._dict.items()))
+        )
+        self.__dict__["_hash"] = value
+        return value
 
     def asdict(self):
         """
@@ -118,11 +209,161 @@ class Config:
         return self._dict
 
 
-class _Never:  # pylint: disable=R0903
+def _is_array(value) -> bool:
+    """Checks whether a value looks like a numpy array."""
+    return hasattr(value, "shape") and hasattr(value, "dtype") and hasattr(value, "tobytes")
+
+
+def _values_equal(value1, value2) -> bool:
+    """
+    Compares two parameter values. Arrays are compared by shape, type and contents rather than
+    elementwise, and aren't considered equal to anything but another array.
     """
-    Type used for hackish equality test (it should always fail, as this should never be
-    constructed).
+    if value1 is value2:
+        return True
+    if _is_array(value1) or _is_array(value2):
+        return (
+            _is_array(value1)
+            and _is_array(value2)
+            and value1.shape == value2.shape
+            and value1.dtype == value2.dtype
+            and value1.tobytes() == value2.tobytes()
+        )
+    try:
+        return bool(value1 == value2)
+    except (TypeError, ValueError):
+        # e.g. containers holding arrays, whose elementwise result has no truth value
+        return False
+
+
+def _dicts_equal(dict1: Optional[dict], dict2: Optional[dict]) -> bool:
+    """Compares two dicts of parameters (or settings) with ``_values_equal``."""
+    if dict1 is None or dict2 is None:
+        return dict1 is dict2
+    if dict1.keys() != dict2.keys():
+        return False
+    return all(_values_equal(value, dict2[name]) for name, value in dict1.items())
+
+
+def _hashable(value):
     """
+    Returns a hashable stand-in for a parameter value that is equal for values which
+    ``_values_equal`` considers equal. Unequal values may share a stand-in.
+    """
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        pass
+    if _is_array(value):
+        return (value.shape, str(value.dtype))
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    if isinstance(value, dict):
+        return len(value)
+    return None
+
+
+class _Exclusions:
+    """
+    Pre-processed ``exclude`` rules from a configuration matrix. Rules are grouped by the
+    parameters they constrain and their values are stored in a set, so checking a configuration
+    takes one hashed lookup per group rather than a comparison per rule. Parameters are looked up
+    by their position in the product's tuples, so no ``dict`` is built for excluded combinations.
+
+    Rules on a single parameter are applied to that parameter's values before the product is
+    taken, so the combinations they exclude are never generated at all.
+    """
+
+    def __init__(self, exclude: List[dict], names: Tuple[str, ...]) -> None:
+        positions = {name: index for index, name in enumerate(names)}
+        hashed: Dict[Tuple[int, ...], Set[tuple]] = {}
+        rules: Dict[Tuple[int, ...], List[tuple]] = {}
+        self._unhashable: List[Tuple[Tuple[int, object], ...]] = []
+
+        for rule in exclude:
+            if any(name not in positions for name in rule):
+                # A rule on a parameter the matrix doesn't have can never match
+                continue
+            indices = tuple(sorted(positions[name] for name in rule))
+            values = tuple(rule[names[index]] for index in indices)
+            try:
+                hash(values)
+            except TypeError:
+                # Rules containing unhashable values are compared one by one
+                self._unhashable.append(tuple(zip(indices, values)))
+                continue
+            hashed.setdefault(indices, set()).add(values)
+            rules.setdefault(indices, []).append(values)
+
+        self._by_parameter = {
+            indices[0]: (excluded, rules[indices])
+            for indices, excluded in hashed.items()
+            if len(indices) == 1
+        }
+        self._groups = [
+            (_tuple_getter(indices), excluded, rules[indices])
+            for indices, excluded in hashed.items()
+            if len(indices) != 1
+        ]
+
+    def __bool__(self) -> bool:
+        """
+        Whether any rules are left for ``matches`` to check.
+        """
+        return bool(self._groups or self._unhashable)
 
-    def __init__(self) -> None:
-        raise Exception("_Never cannot be constructed")
+    def allowed_values(self, index: int, values: Iterable) -> Iterable:
+        """
+        Returns the values of the parameter at ``index`` that no single parameter rule excludes.
+        """
+        if index not in self._by_parameter:
+            return values
+        excluded, rules = self._by_parameter[index]
+        allowed = []
+        for value in values:
+            probe = (value,)
+            try:
+                if probe in excluded:
+                    continue
+            except TypeError:
+                # The value is unhashable, fall back to comparing each rule
+                if any(probe == rule for rule in rules):
+                    continue
+            allowed.append(value)
+        return allowed
+
+    def matches(self, element: tuple) -> bool:
+        """
+        Checks whether a configuration, given as a tuple of parameter values in the matrix'
+        order, is excluded.
+        """
+        for getter, excluded, rules in self._groups:
+            probe = getter(element)
+            try:
+                if probe in excluded:
+                    return True
+            except TypeError:
+                # The configuration has an unhashable value, fall back to comparing each rule
+                if any(probe == rule for rule in rules):
+                    return True
+
+        return any(
+            all(element[index] == value for (index, value) in rule)
+            for rule in self._unhashable
+        )
+
+
+def _tuple_getter(indices: Tuple[int, ...]) -> Callable[[tuple], tuple]:
+    """
+    Returns a function picking the items at ``indices`` out of a tuple, as a tuple. Unlike
+    ``operator.itemgetter``, a single index still gives a tuple.
+    """
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda element: (element[index],)
+    if not indices:
+        return lambda element: ()
+    return operator.itemgetter(*indices)
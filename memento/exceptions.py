@@ -36,3 +36,19 @@ class CyclicDependency(Exception):
 
     def __init__(self) -> None:
         super().__init__("Cyclic dependency detected")
+
+
+class RemoteTaskError(Exception):
+    """
+    Stands in for an exception raised by a task in a worker process that couldn't be sent back to
+    the parent process, e.g. because its class requires arguments that pickle doesn't restore.
+    """
+
+    def __init__(self, type_name: str, message: str, traceback: str) -> None:
+        super().__init__(f"{type_name}: {message}\n{traceback}")
+        self.type_name = type_name
+        self.message = message
+        self.traceback = traceback
+
+    def __reduce__(self):
+        return RemoteTaskError, (self.type_name, self.message, self.traceback)
@@ -3,23 +3,25 @@ Contains `Memento`, the main entry point of MEMENTO.
 """
 
 import functools
+import itertools
 import logging
 import os
-from datetime import datetime
-from typing import Callable, List, Optional, Dict, Any, cast
-from networkx import DiGraph, is_directed_acyclic_graph, topological_sort  # type: ignore
-
-import cloudpickle
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, NamedTuple, Optional, Dict, Any, Tuple
 
 from memento.notifications import NotificationProvider, DefaultNotificationProvider
 from memento.parallel import TaskManager, delayed
-from memento.caching import FileSystemCacheProvider, CacheProvider
+from memento.caching import FileSystemCacheProvider, CacheProvider, _hash_pickle
 from memento.configurations import generate_configurations, Config
 from memento.task_interface import Context, Result, FileSystemCheckpointing
 from memento.exceptions import CacheMiss, CyclicDependency
 
 logger = logging.getLogger(__name__)
 
+# Number of configurations looked up in the cache at once
+_LOOKUP_BATCH_SIZE = 1000
+
 
 class Memento:
     """
@@ -50,79 +52,138 @@ class Memento:
         """
         self._matrices.append(matrix)
 
-    def _get_execution_order(self):
-        # Construct graph representation of matrices
+    def _get_execution_order(self) -> Tuple[List[List[dict]], Dict[Any, List[dict]]]:
+        """
+        Groups this object's matrices into waves. Each matrix only depends on matrices from earlier
+        waves, so the matrices within a wave can be run together.
 
-        graph_edges = []
+        :returns: The waves, and the matrices that depend on each matrix, by its id.
+        """
+        id_matrix_map = {matrix["id"]: matrix for matrix in self._matrices}
 
+        # Construct graph representation of matrices: the matrices that depend on each matrix, and
+        # how many dependencies each matrix has left to run
+        dependants: Dict[Any, List[Any]] = {id_: [] for id_ in id_matrix_map}
+        in_degree = {}
         for matrix in self._matrices:
             for dependency in matrix["dependencies"]:
-                graph_edges.append(tuple([matrix["id"], dependency]))
-
-        graph = DiGraph()
-        graph.add_edges_from(graph_edges)
-        graph.add_nodes_from(matrix["id"] for matrix in self._matrices)
-
-        # Validate graph
-
-        if not is_directed_acyclic_graph(graph):
+                dependants[dependency].append(matrix["id"])
+            in_degree[matrix["id"]] = len(matrix["dependencies"])
+
+        # Get execution order via Kahn's algorithm, one wave at a time
+        waves = []
+        wave = [id_ for id_, degree in in_degree.items() if degree == 0]
+        while wave:
+            waves.append([id_matrix_map[id_] for id_ in wave])
+            next_wave = []
+            for id_ in wave:
+                for dependant in dependants[id_]:
+                    in_degree[dependant] -= 1
+                    if in_degree[dependant] == 0:
+                        next_wave.append(dependant)
+            wave = next_wave
+
+        # Validate graph, matrices in a cycle never run out of dependencies
+
+        if sum(len(wave) for wave in waves) < len(id_matrix_map):
             raise CyclicDependency()
 
-        # Get execution order via a topological sort
-        id_matrix_map = {matrix["id"]: matrix for matrix in self._matrices}
-        matrices = [id_matrix_map[id_] for id_ in list(topological_sort(graph))[::-1]]
-        return matrices
+        dependant_matrices = {
+            id_: [id_matrix_map[dependant] for dependant in ids]
+            for id_, ids in dependants.items()
+        }
+        return waves, dependant_matrices
 
-    def run_all(self, **kwargs) -> Optional[Dict[Any, Optional[List[Result]]]]:
+    def run_all(  # pylint: disable=too-many-locals
+        self, **kwargs
+    ) -> Optional[Dict[Any, Optional[List[Result]]]]:
         """
-        Runs this object's configuration matrices and returns their results.
+        Runs this object's configuration matrices and returns their results. Matrices which don't
+        depend on each other have their tasks run together.
 
         :param kwargs: keyword arguments to Memento.run
         """
-        matrices = self._get_execution_order()
+        waves, dependants = self._get_execution_order()
+        dry_run = kwargs.pop("dry_run", False)
 
-        n_matrices = len(matrices)
+        n_waves = len(waves)
 
         results: Dict[Any, Optional[List[Result]]] = {
-            matrix["id"]: None for matrix in matrices
+            matrix["id"]: None for wave in waves for matrix in wave
         }
 
-        # Run each matrix
-        for i in range(n_matrices):
-            matrix = matrices[i]
+        # Run each wave of matrices
+        for i in range(n_waves):
+            wave = waves[i]
 
-            if kwargs.get("dry_run"):
-                configs = generate_configurations(matrix)
+            if dry_run:
+                wave_inners = {}
+                for matrix in wave:
+                    logger.info("Running configurations for matrix '%s':", matrix["id"])
+                    inners = []
+                    for config in generate_configurations(matrix):
+                        logger.info("  %s", config)
+                        inners.append(config)
 
-                logger.info("Running configurations for matrix '%s':", matrix["id"])
-                for config in configs:
-                    logger.info("  %s", config)
+                    wave_inners[matrix["id"]] = inners
 
-                if i == n_matrices - 1:
+                if i == n_waves - 1:
                     logger.info("Exiting due to dry run")
                     return None
-
-                inners = list(configs)
             else:
-                results[matrix["id"]] = self.run(
-                    matrix, **kwargs, notify_on_complete=False
-                )
+                wave_results = self._run_wave(wave, **kwargs)
+                results.update(wave_results)
 
-                if i == n_matrices - 1:
+                if i == n_waves - 1:
                     break
 
-                inners = [result.inner for result in cast(List, results[matrix["id"]])]
+                wave_inners = {
+                    id_: [result.inner for result in wave_result]
+                    for id_, wave_result in wave_results.items()
+                }
 
-            # Update all matrices that depend on the matrix that was just run
-            for mat in matrices[i + 1 :]:
-                if matrix["id"] in mat["dependencies"]:
-                    mat["parameters"][str(matrix["id"])] = inners
+            # Update all matrices that depend on the matrices that were just run
+            for id_, inners in wave_inners.items():
+                for mat in dependants[id_]:
+                    mat["parameters"][str(id_)] = inners
 
         self._notification_provider.all_tasks_completed()
 
         return results
 
-    def run(  # pylint: disable=too-many-arguments, too-many-locals
+    def _run_wave(
+        self,
+        wave: List[dict],
+        force_run: bool = False,
+        force_cache: bool = False,
+        cache_path: Optional[str] = None,
+    ) -> Dict[Any, List[Result]]:
+        """
+        Runs the tasks of several configuration matrices with a single task manager.
+
+        :returns: The results of each matrix, by matrix id.
+        """
+        with TaskManager(
+            workers=self._workers,
+            notification_provider=self._notification_provider,
+            notify_on_complete=False,
+        ) as manager:
+            pending = {}
+            for matrix in wave:
+                logger.info("Running configurations for matrix '%s':", matrix["id"])
+                pending[matrix["id"]] = self._add_tasks(
+                    generate_configurations(matrix),
+                    manager,
+                    force_run,
+                    force_cache,
+                    cache_path,
+                )
+
+            manager.run()
+
+        return {id_: self._collect_results(run) for id_, run in pending.items()}
+
+    def run(  # pylint: disable=too-many-arguments
         self,
         matrix: dict,
         dry_run: bool = False,
@@ -149,13 +210,36 @@ class Memento:
         configs = generate_configurations(matrix)
 
         logger.info("Running configurations:")
-        for config in configs:
-            logger.info("  %s", config)
 
         if dry_run:
+            for config in configs:
+                logger.info("  %s", config)
             logger.info("Exiting due to dry run")
             return None
 
+        with TaskManager(
+            workers=self._workers,
+            notification_provider=self._notification_provider,
+            notify_on_complete=notify_on_complete
+        ) as manager:
+            run = self._add_tasks(configs, manager, force_run, force_cache, cache_path)
+
+            manager.run()
+
+        return self._collect_results(run)
+
+    def _add_tasks(  # pylint: disable=too-many-arguments, too-many-locals
+        self,
+        configs: Iterable[Config],
+        manager: TaskManager,
+        force_run: bool,
+        force_cache: bool,
+        cache_path: Optional[str],
+    ) -> "_PendingRun":
+        """
+        Logs the given configurations, then adds a task to the given task manager for each one
+        without a cached result.
+        """
         cache_provider = FileSystemCacheProvider(
             filepath=(
                 cache_path
@@ -169,62 +253,89 @@ class Memento:
             filepath=(cache_path or "memento.sqlite"),
             key=_key_provider,
         )
-        manager = TaskManager(
-            workers=self._workers,
-            notification_provider=self._notification_provider,
-            notify_on_complete=notify_on_complete
-        )
 
-        # Run tasks for which we have no cached result
+        # Configurations are streamed in batches: each batch is logged while its keys are
+        # computed, then checked against the cache with one query. Only the configurations with
+        # no cached result are kept, inside their tasks.
+        wrapper = _Wrapper(self.func)
+        keys: List[bytes] = []
         ran = []
-        for config in configs:
-            key = _key_provider(self.func, config)
-            if not cache_provider.contains(key) or force_run:
-                if force_cache:
-                    raise CacheMiss(config)
-                context = Context(key, checkpoint_provider)
-                manager.add_task(
-                    delayed(_wrapper(self.func))(context, config, cache_provider)
-                )
-                ran.append(config)
-
-        manager.run()
-
-        results = [
-            cache_provider.get(_key_provider(self.func, config)) for config in configs
-        ]
+        config_iterator = iter(configs)
+        while batch := list(itertools.islice(config_iterator, _LOOKUP_BATCH_SIZE)):
+            batch_keys = []
+            for config in batch:
+                logger.info("  %s", config)
+                batch_keys.append(_key_provider(self.func, config))
+
+            # Run tasks for which we have no cached result
+            cached = set() if force_run else cache_provider.contains_many(batch_keys)
+            for config, key in zip(batch, batch_keys):
+                if key not in cached:
+                    if force_cache:
+                        raise CacheMiss(config)
+                    context = Context(key, checkpoint_provider)
+                    manager.add_task(delayed(wrapper)(context, config, cache_provider))
+                    ran.append(len(keys))
+                keys.append(key)
+
+        return _PendingRun(keys, ran, cache_provider, checkpoint_provider)
+
+    @staticmethod
+    def _collect_results(run: "_PendingRun") -> List[Result]:
+        """
+        Gets the results of a run from the cache, once its tasks have been run.
+        """
+        results = run.cache_provider.get_many(run.keys)
 
-        for config in configs:
-            checkpoint_provider.remove(_key_provider(self.func, config))
+        run.checkpoint_provider.remove_many(run.keys)
 
-        for result in results:
-            if result.config in ran:
-                result.was_cached = False
+        for index in run.ran:
+            results[index].was_cached = False
 
         logger.info(
             "%s/%s results retrieved from cache",
-            len(configs) - len(ran),
-            len(configs),
+            len(run.keys) - len(run.ran),
+            len(run.keys),
         )
 
         return results
 
 
-def _wrapper(func: Callable) -> Callable:
+class _PendingRun(NamedTuple):
+    """
+    A matrix whose tasks have been added to a task manager, but not collected yet.
+    """
+
+    keys: List[bytes]
+    ran: List[int]
+    cache_provider: CacheProvider
+    checkpoint_provider: FileSystemCheckpointing
+
+
+class _Wrapper:  # pylint: disable=too-few-public-methods
     """
     Wrapper which runs in the task thread. This is responsible for collecting performance metrics
-    and writing to the cache.
+    and writing to the cache. It's a class rather than a closure so that tasks can be pickled by
+    reference.
     """
 
-    @functools.wraps(func)
-    def inner(
-        context: Context, config: Config, cache_provider: CacheProvider
+    def __init__(self, func: Callable):
+        self._func = func
+        functools.update_wrapper(
+            self, func, assigned=("__module__", "__name__", "__qualname__")
+        )
+
+    def __call__(
+        self, context: Context, config: Config, cache_provider: CacheProvider
     ) -> Result:
+        # The wall clock is only read for the start time, runtime is measured with the
+        # monotonic performance counter
         start_time = datetime.now()
+        start = time.perf_counter_ns()
 
-        inner = func(context, config)
+        inner = self._func(context, config)
 
-        runtime = datetime.now() - start_time
+        runtime = timedelta(microseconds=(time.perf_counter_ns() - start) // 1000)
 
         result = Result(
             config,
@@ -240,9 +351,9 @@ def _wrapper(func: Callable) -> Callable:
         context.checkpoint(result)
         return result
 
-    return inner
-
 
-def _key_provider(func: Callable, config: Config):
-    # The default behaviour caches on all arguments, including the config object.
-    return cloudpickle.dumps({"function": func.__name__, "args": [config]})
+def _key_provider(func: Callable, config: Config) -> bytes:
+    # The default behaviour caches on all arguments, including the config object. Names can't
+    # contain a null byte, so it separates the name from the pickled config unambiguously. The
+    # pickle is hashed as it's written, so keys are 16 bytes however big the config is.
+    return _hash_pickle(config, prefix=func.__name__.encode() + b"\0")
@@ -3,9 +3,21 @@ Contains classes for progress reporting.
 """
 import email
 from email.utils import formataddr
+import io
+import logging
+import queue
 import smtplib
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import Union, TextIO, Iterable, NamedTuple, Optional
+from typing import Union, TextIO, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Connections idle for longer than this are replaced rather than reused, servers commonly drop
+# idle clients after a few minutes
+_MAX_IDLE_SECONDS = 100.0
 
 
 class NotificationProvider(ABC):
@@ -80,14 +92,38 @@ class FileSystemNotificationProvider(DefaultNotificationProvider):
         """
         self._filepath = filepath if isinstance(filepath, str) else "logs.txt"
         self._file = filepath if not isinstance(filepath, str) else None
+        # Handle to ``_filepath``, opened on first write and kept open for later writes
+        self._opened_file: Optional[TextIO] = None
+
+    def __getstate__(self):
+        # File handles can't be pickled, the unpickled provider opens its own.
+        state = self.__dict__.copy()
+        state["_opened_file"] = None
+        return state
 
     def _write(self, message: str):
         str_ = f"{message}\n"
         if self._file:
             self._file.write(str_)
-        else:
-            with open(self._filepath, "a") as file:
-                file.write(str_)
+            return
+
+        if self._opened_file is None:
+            # pylint: disable-next=consider-using-with
+            self._opened_file = open(self._filepath, "a", buffering=io.DEFAULT_BUFFER_SIZE)
+            weakref.finalize(self, self._opened_file.close)
+        self._opened_file.write(str_)
+        # Each notification is flushed straight away so it can be followed while tasks run, and
+        # isn't lost if the process is terminated without flushing its buffers
+        self._opened_file.flush()
+
+    def close(self):
+        """
+        Closes the notification file, if this provider opened it. It's reopened by the next
+        notification.
+        """
+        if self._opened_file is not None:
+            self._opened_file.close()
+            self._opened_file = None
 
     def task_completed(self):
         self._write("Task completed")
@@ -157,8 +193,22 @@ class EmailNotificationProvider(DefaultNotificationProvider):
             else SmtpConfiguration("localhost", 0)
         )
         self._client = smtp if isinstance(smtp, smtplib.SMTP) else None
+        # Connection made from the SMTP configuration, opened on first send and reused after that
+        self._connection: Optional[smtplib.SMTP] = None
+        self._connection_finalizer: Optional[weakref.finalize] = None
+        self._last_sent = 0.0
         self._from_addr = from_addr
-        self._to_addrs = to_addrs
+        # Copied so an iterator isn't used up by the first message, the header is the same for
+        # every message so it's only joined here
+        self._to_addrs = list(to_addrs)
+        self._to_header = ",".join(self._to_addrs)
+
+    def __getstate__(self):
+        # Connections can't be pickled, the unpickled provider opens its own.
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_connection_finalizer"] = None
+        return state
 
     @property
     def smpt(self):
@@ -175,45 +225,247 @@ class EmailNotificationProvider(DefaultNotificationProvider):
         """Email addresses emails will be sent to."""
         return self._to_addrs
 
+    def _connect(self) -> smtplib.SMTP:
+        """
+        Connects and logs in to the configured SMTP server.
+        """
+        smtp = smtplib.SMTP(self._smpt_config.host, self._smpt_config.port)
+        try:
+            try:
+                smtp.starttls()
+            except smtplib.SMTPNotSupportedError as error:
+                if self._smpt_config.require_tls:
+                    raise error
+
+            if (
+                self._smpt_config.username is not None
+                and self._smpt_config.password is not None
+            ):
+                smtp.login(self._smpt_config.username, self._smpt_config.password)
+        except Exception:
+            smtp.close()
+            raise
+
+        self._connection_finalizer = weakref.finalize(self, _quit, smtp)
+        return smtp
+
     def _send_email(self, message: email.message.Message):
         if self._client:
             self._client.send_message(message)
-        else:
-            with smtplib.SMTP(self._smpt_config.host, self._smpt_config.port) as smtp:
-                try:
-                    smtp.starttls()
-                except smtplib.SMTPNotSupportedError as error:
-                    if self._smpt_config.require_tls:
-                        raise error
-
-                if (
-                    self._smpt_config.username is not None
-                    and self._smpt_config.password is not None
-                ):
-                    smtp.login(self._smpt_config.username, self._smpt_config.password)
-                smtp.send_message(message)
+            return
+
+        if time.monotonic() - self._last_sent > _MAX_IDLE_SECONDS:
+            self._close_connection()
+        if self._connection is None:
+            self._connection = self._connect()
+        try:
+            self._connection.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server may close idle connections, so reconnect and try once more
+            self._close_connection()
+            self._connection = self._connect()
+            self._connection.send_message(message)
+        self._last_sent = time.monotonic()
+
+    def close(self):
+        """
+        Closes this provider's connection to the SMTP server, if it opened one. A new connection
+        is made by the next notification.
+        """
+        self._close_connection()
+
+    def _close_connection(self):
+        if self._connection_finalizer is not None:
+            self._connection_finalizer()
+        self._connection = None
+        self._connection_finalizer = None
 
     def create_message(self, subject: str, content: str) -> email.message.Message:
         """Creates an :class:`email.message.Message` with the given subject and content."""
         message = email.message.EmailMessage()
         message["From"] = formataddr(("Memento", self._from_addr))
-        message["To"] = ",".join(self._to_addrs)
+        message["To"] = self._to_header
         message["Subject"] = subject
         message.set_content(
             content
         )  # TODO: Maybe support HTML messages with a plain text fallback
         return message
 
+    def _notify(self, subject: str, content: str):
+        self._send_email(self.create_message(subject, content))
+
     def task_completed(self):
-        message = self.create_message("[Memento] Task completed", "Task completed")
-        self._send_email(message)
+        self._notify("[Memento] Task completed", "Task completed")
 
     def all_tasks_completed(self):
-        message = self.create_message(
-            "[Memento] All tasks completed", "All tasks completed"
-        )
-        self._send_email(message)
+        self._notify("[Memento] All tasks completed", "All tasks completed")
 
     def task_failure(self):
-        message = self.create_message("[Memento] Task failed", "Task failed")
-        self._send_email(message)
+        self._notify("[Memento] Task failed", "Task failed")
+
+
+class BatchEmailNotificationProvider(EmailNotificationProvider):
+    """
+    Sends notifications via email from a background thread, so raising a notification doesn't
+    wait for the SMTP server.
+
+    Queued notifications are collected into batches of up to ``max_batch`` messages, waiting at
+    most ``max_wait`` seconds for a batch to fill, and each batch is sent over a single
+    connection. Call :meth:`flush` to wait until every queued notification has been sent, and
+    :meth:`close` to stop the background thread once the provider is no longer needed.
+    """
+
+    def __init__(
+        self,
+        smtp: Union[SmtpConfiguration, smtplib.SMTP],
+        from_addr: str,
+        to_addrs: Iterable[str],
+        max_batch: int = 64,
+        max_wait: float = 0.01,
+    ):
+        """
+        Creates a BatchEmailNotificationProvider.
+
+        :param smtp: SMTP configuration or a smtplib.SMTP object
+        :param from_addr: email address emails will be sent from
+        :param to_addrs: email addresses emails will be sent to
+        :param max_batch: maximum number of notifications sent in one batch
+        :param max_wait: maximum time, in seconds, to wait for more notifications before
+            sending a batch
+        """
+        super().__init__(smtp, from_addr, to_addrs)
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        # Started by the first notification
+        self._queue: Optional["queue.Queue[Optional[email.message.Message]]"] = None
+        self._sender: Optional[threading.Thread] = None
+        self._sender_finalizer: Optional[weakref.finalize] = None
+        self._errors: List[Exception] = []
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_queue"] = None
+        state["_sender"] = None
+        state["_sender_finalizer"] = None
+        state["_errors"] = []
+        return state
+
+    def _notify(self, subject: str, content: str):
+        messages = self._queue
+        if messages is None:
+            messages = self._queue = queue.Queue()
+            # The thread sends through a provider of its own and never references this one, so
+            # the finalizer can stop it once this provider is garbage collected (or at exit)
+            delivery = EmailNotificationProvider(
+                self._client or self._smpt_config, self._from_addr, self._to_addrs
+            )
+            self._sender = threading.Thread(
+                target=_send_batches,
+                args=(delivery, messages, self._errors, self._max_batch, self._max_wait),
+                daemon=True,
+            )
+            self._sender.start()
+            self._sender_finalizer = weakref.finalize(
+                self, _stop_sender, messages, self._sender
+            )
+        messages.put(self.create_message(subject, content))
+
+    def _raise_errors(self):
+        """
+        Raises the first error raised while sending queued notifications since the last call.
+        """
+        if self._errors:
+            error = self._errors[0]
+            self._errors.clear()
+            raise error
+
+    def flush(self):
+        """
+        Waits until all queued notifications have been sent. :class:`TaskManager` calls this at
+        the end of each run.
+
+        :raises Exception: the first error raised while sending the notifications, if any
+        """
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_errors()
+
+    def close(self):
+        """
+        Sends any queued notifications, then stops the background thread and closes the
+        connection to the SMTP server. A new thread and connection are started by the next
+        notification.
+
+        :raises Exception: the first error raised while sending the notifications, if any
+        """
+        if self._sender_finalizer is not None:
+            self._sender_finalizer()
+        self._queue = None
+        self._sender = None
+        self._sender_finalizer = None
+        self._raise_errors()
+
+
+def _send_batches(
+    provider: EmailNotificationProvider,
+    messages: "queue.Queue[Optional[email.message.Message]]",
+    errors: List[Exception],
+    max_batch: int,
+    max_wait: float,
+):
+    """
+    Sends the messages queued for a :class:`BatchEmailNotificationProvider`, in batches, until
+    ``None`` is queued, then closes the provider's connection.
+
+    :param provider: provider whose connection the messages are sent over
+    :param messages: queue of messages to send, ``None`` stops the thread
+    :param errors: list errors raised while sending are added to, they're also logged
+    :param max_batch: maximum number of messages sent in one batch
+    :param max_wait: maximum time, in seconds, to wait for a batch to fill
+    """
+    while True:
+        batch = [messages.get()]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_batch and batch[-1] is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(messages.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        for message in batch:
+            if message is not None:
+                # Each message is sent on its own, so one failure doesn't lose the rest
+                try:
+                    provider._send_email(message)  # pylint: disable=protected-access
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.error("Failed to send notification email", exc_info=error)
+                    errors.append(error)
+            messages.task_done()
+        if batch[-1] is None:
+            provider.close()
+            return
+
+
+def _stop_sender(
+    messages: "queue.Queue[Optional[email.message.Message]]", sender: threading.Thread
+):
+    """
+    Stops a thread started by :func:`_send_batches` once it has sent the queued messages.
+    """
+    messages.put(None)
+    # The garbage collector can run finalizers in any thread, including the sender itself
+    if sender is not threading.current_thread():
+        sender.join()
+
+
+def _quit(smtp: smtplib.SMTP):
+    """
+    Ends an SMTP session, closing the connection even if the server has already gone away.
+    """
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
@@ -1,16 +1,21 @@
 """
 Contains classes and functions for running tasks in parallel.
 """
+import io
+import os
+import pickle
 import sys
+import traceback
+import types
+import weakref
 from contextlib import redirect_stdout, redirect_stderr, contextmanager
-from functools import wraps
-from heapq import heapify
+from functools import partial, update_wrapper
 from multiprocessing.pool import Pool
-from typing import Callable, List, TextIO, Iterable
+from typing import Callable, List, Optional, TextIO, Iterable, Tuple
 
 import cloudpickle
 
-from .exceptions import AggregateException
+from .exceptions import AggregateException, RemoteTaskError
 from .notifications import DefaultNotificationProvider, NotificationProvider
 
 
@@ -24,15 +29,66 @@ def delayed(func: Callable):
     """
 
     def args_wrapper(*args, **kwargs):
-        @wraps(func)
-        def wrapped():
-            return func(*args, **kwargs)
-
+        # A partial, unlike a closure, can be pickled by reference when func and its arguments
+        # can be. The docstring is left out, it would only make the pickle bigger.
+        wrapped = partial(func, *args, **kwargs)
+        update_wrapper(
+            wrapped, func, assigned=("__module__", "__name__", "__qualname__")
+        )
         return wrapped
 
     return args_wrapper
 
 
+_PICKLE: int = 0
+_CLOUDPICKLE: int = 1
+
+
+class _ReferencePickler(pickle.Pickler):
+    """
+    A pickler that refuses to pickle functions and classes defined in ``__main__``.
+
+    pickle would store them by reference, which fails when a worker's ``__main__`` doesn't define
+    them (e.g. when functions defined in a notebook are sent to spawned processes). Refusing them
+    lets ``_fast_dumps`` fall back to cloudpickle, which stores them by value.
+    """
+
+    def reducer_override(self, obj):
+        """Raises ``PicklingError`` for functions and classes defined in ``__main__``."""
+        if (
+            isinstance(obj, (type, types.FunctionType))
+            and getattr(obj, "__module__", None) == "__main__"
+        ):
+            raise pickle.PicklingError(f"{obj!r} is defined in __main__")
+        return NotImplemented
+
+
+def _fast_dumps(obj) -> Tuple[int, bytes]:
+    """
+    Serializes the given object with pickle, falling back to cloudpickle for objects pickle can't
+    handle (lambdas, closures, etc.) or that reference code in ``__main__``. pickle is much faster
+    for ordinary objects.
+
+    Returns a tuple of (serializer, data) to pass to ``_fast_loads``.
+    """
+    try:
+        file = io.BytesIO()
+        _ReferencePickler(file, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+        return _PICKLE, file.getvalue()
+    except Exception:  # pylint: disable=broad-except
+        return _CLOUDPICKLE, cloudpickle.dumps(obj)
+
+
+def _fast_loads(serialized: Tuple[int, bytes]):
+    """
+    Deserializes an object serialized by ``_fast_dumps``.
+    """
+    serializer, data = serialized
+    if serializer == _PICKLE:
+        return pickle.loads(data)
+    return cloudpickle.loads(data)
+
+
 @contextmanager
 def _redirect_stdio(prefix: str):
     """
@@ -68,13 +124,12 @@ class _Task:
         index: int,
         task: Callable,
         priority: int,
-        notification_provider: NotificationProvider,
     ):
         self._identifier = identifier
-        self._task = cloudpickle.dumps(task)
+        # Serialized straight away so the task captures its arguments as they are when it's added
+        self._task = _fast_dumps(task)
         self._priority = priority
         self._index = index
-        self._notification_provider = cloudpickle.dumps(notification_provider)
 
     @property
     def identifier(self):
@@ -88,24 +143,16 @@ class _Task:
 
     def run(self):
         """Runs this task and returns it's result."""
-        notification_provider = cloudpickle.loads(self._notification_provider)
-
-        try:
-            task_return = cloudpickle.loads(self._task)()
-            notification_provider.task_completed()
-            return cloudpickle.dumps(task_return)
-        except Exception as exception:
-            notification_provider.task_failure()
-            raise exception
+        return _fast_loads(self._task)()
 
     def __lt__(self, other: "_Task"):
         """Compares the priority between two tasks"""
         return self._priority < other._priority
 
 
-def _worker(task: "_Task"):
+def _run_task(task: "_Task"):
     """
-    Initializer function for pool.map.
+    Runs a task, prefixing anything it outputs with its identifier.
 
     Returns a tuple of (task_index, task_result, exception)
     """
@@ -116,6 +163,48 @@ def _worker(task: "_Task"):
             return task.index, None, exception
 
 
+def _worker(task: "_Task"):
+    """
+    Initializer function for pool.map.
+
+    Returns a tuple of (task_index, task_result, exception). The result is serialized with
+    ``_fast_dumps``, since the pool can only send results that pickle can handle.
+    """
+    index, result, exception = _run_task(task)
+    if exception is None:
+        try:
+            result = _fast_dumps(result)
+        except Exception as serialization_error:  # pylint: disable=broad-except
+            # A result that can't be sent back fails the task, as an exception in it would
+            result, exception = None, serialization_error
+    if exception is not None:
+        exception = _portable_exception(exception)
+    return index, result, exception
+
+
+def _portable_exception(exception: Exception) -> Exception:
+    """
+    Returns the given exception if it survives a round trip through pickle, otherwise a
+    ``RemoteTaskError`` holding its type name, message and traceback.
+
+    An exception that pickles but can't be unpickled would otherwise break the pool's result
+    handler in the parent process.
+    """
+    try:
+        pickle.loads(pickle.dumps(exception, protocol=pickle.HIGHEST_PROTOCOL))
+        return exception
+    except Exception:  # pylint: disable=broad-except
+        return RemoteTaskError(
+            type(exception).__name__,
+            str(exception),
+            "".join(
+                traceback.format_exception(
+                    type(exception), exception, exception.__traceback__
+                )
+            ),
+        )
+
+
 TASK_PRIORITY_LOW: int = 3
 TASK_PRIORITY_MEDIUM: int = 2
 TASK_PRIORITY_HIGH: int = 1
@@ -137,6 +226,15 @@ class TaskManager:
         results = manager.run()
         print(results) # [3]
 
+    Worker processes are started by the first ``run`` and reused by later ones, until ``close``
+    is called. A task manager can be used as a context manager to close it afterwards.
+
+    ::
+
+        with TaskManager() as manager:
+            manager.add_task(delayed(sum)([1, 2]))
+            manager.run()
+
 
     """
 
@@ -150,7 +248,8 @@ class TaskManager:
         """
         Creates a TaskManager.
 
-        :param workers: max number of worker processes
+        :param workers: max number of worker processes. With 1, tasks are run one after another
+            in the calling process instead.
         :param max_tasks_per_worker: max number of tasks each worker process can execute before
             it's replaced by a new process
         :param notification_provider: notification provider to use
@@ -166,6 +265,54 @@ class TaskManager:
             notification_provider or DefaultNotificationProvider()
         )
         self._notify_on_complete = notify_on_complete
+        self._pool: Optional[Pool] = None
+        self._pool_size = 0
+        self._pool_finalizer: Optional[weakref.finalize] = None
+
+    def __enter__(self) -> "TaskManager":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _get_pool(self, task_count: int) -> Pool:
+        """
+        Gets this task manager's pool of worker processes, with enough workers for
+        ``task_count`` tasks (up to the maximum). Workers that would sit idle aren't started, the
+        pool is restarted with more workers if a later run has more tasks.
+        """
+        size = min(self._workers or os.cpu_count() or 1, task_count)
+        if self._pool is not None and self._pool_size < size:
+            self.close()
+        if self._pool is None:
+            self._pool = Pool(
+                processes=size, maxtasksperchild=self._max_tasks_per_worker
+            )
+            self._pool_size = size
+            # Stops the workers if the task manager is discarded without being closed
+            self._pool_finalizer = weakref.finalize(self, self._pool.terminate)
+        return self._pool
+
+    def close(self) -> None:
+        """
+        Stops this task manager's worker processes, if any were started. A later ``run`` starts
+        new ones.
+        """
+        if self._pool is None:
+            return
+        assert self._pool_finalizer is not None
+        self._pool_finalizer.detach()
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+        self._pool_size = 0
+        self._pool_finalizer = None
+
+    def reset(self) -> None:
+        """
+        Removes any tasks that were added but haven't been run. Worker processes are kept.
+        """
+        self._tasks.clear()
 
     def _create_task(self, callable_: Callable, priority_: int) -> _Task:
         self._id_count += 1
@@ -174,7 +321,6 @@ class TaskManager:
             self._task_index,
             callable_,
             priority_,
-            self._notification_provider,
         )
         self._task_index += 1
         return task
@@ -202,23 +348,67 @@ class TaskManager:
 
     def run(self):
         """Runs this task manager's tasks and returns the results."""
-        heapify(self._tasks)
-        with Pool(
-            processes=self._workers, maxtasksperchild=self._max_tasks_per_worker
-        ) as pool:
-            results = pool.map(_worker, self._tasks)
+        tasks = sorted(self._tasks)
+
+        if not tasks:
+            # Nothing to run (e.g. every configuration was cached), so no workers are started
+            results = []
+        elif self._workers == 1:
+            # With a single worker, tasks are run in this process in priority order. This skips
+            # starting a pool and sending tasks and results between processes.
+            results = self._collect_results(map(_run_task, tasks))
+        else:
+            # Tasks are dispatched in priority order. Small chunks let workers start as soon as
+            # their first tasks are sent, and let quick workers pick up the slack from slow ones.
+            pool = self._get_pool(len(tasks))
+            chunksize = max(1, len(tasks) // self._pool_size // 4)
+            results = self._collect_results(
+                (index, _fast_loads(result) if exception is None else None, exception)
+                for index, result, exception in pool.imap_unordered(
+                    _worker, tasks, chunksize=chunksize
+                )
+            )
 
         self._tasks.clear()
 
         exceptions = [result[2] for result in results if result[2] is not None]
 
         if exceptions:
-            raise AggregateException(exceptions)
+            # Task failures are raised even if sending their notifications failed too
+            try:
+                self._flush_notifications()
+            finally:
+                raise AggregateException(exceptions)
 
         results.sort(key=lambda t: t[0])
-        results = [cloudpickle.loads(item[1]) for item in results]
+        results = [item[1] for item in results]
 
         if self._notify_on_complete:
             self._notification_provider.all_tasks_completed()
+        self._flush_notifications()
 
         return results
+
+    def _flush_notifications(self):
+        """
+        Waits for providers that send notifications in the background (those with a ``flush``
+        method) to deliver them, raising any error they hit while sending.
+        """
+        flush = getattr(self._notification_provider, "flush", None)
+        if flush is not None:
+            flush()
+
+    def _collect_results(self, results: Iterable[tuple]) -> List[tuple]:
+        """
+        Collects ``(task_index, task_result, exception)`` tuples as tasks finish, raising a
+        notification for each one. Notifications are raised here rather than in the workers, so the
+        provider is never sent to them.
+        """
+        collected = []
+        for result in results:
+            if result[2] is None:
+                self._notification_provider.task_completed()
+            else:
+                self._notification_provider.task_failure()
+            collected.append(result)
+        return collected
@@ -3,24 +3,213 @@ Contains MEMENTO's task interface, once the configurations are
 generated and dispatched to tasks, we need some way to interact
 with the user code
 """
+import atexit
 import datetime
 import os
+from array import array
+import pathlib
+import queue
 import sqlite3
-import tempfile
+import threading
 import time
 from collections import namedtuple
-from typing import Any, Optional, Union, Tuple, Dict, List, cast
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Optional,
+    Union,
+    Tuple,
+    Dict,
+    Iterable,
+    Sequence,
+    Iterator,
+    TYPE_CHECKING,
+)
 from typing import Callable
 
-import cloudpickle
-import pandas as pd
-from pandas import DataFrame
-
 from memento.configurations import Config
-from memento.caching import default_key_provider
-
+from memento.caching import (
+    Key,
+    default_key_provider,
+    _batches,
+    _database_path,
+    _dumps_item,
+    _loads_item,
+)
+
+# A single recorded metric value. ``Context`` stores values in columns rather than as Metric
+# objects, the fields name the columns of the dataframes returned by ``collect_metrics``.
 Metric = namedtuple("Metric", "x y")
 
+if TYPE_CHECKING:
+    # pandas takes a while to import, so it's only imported once metrics are collected
+    import pandas as pd
+
+
+def _as_bytes(key: Key) -> bytes:
+    """
+    Returns the given key as bytes, which SQLite stores and compares as a BLOB. Strings are
+    encoded as UTF-8, so they match the same bytes key.
+    """
+    return key.encode() if isinstance(key, str) else key
+
+
+def _open_connection(filepath: str, read_only: bool = False) -> sqlite3.Connection:
+    """
+    Opens a connection to a checkpoint database. WAL lets tasks checkpoint concurrently without
+    blocking each other's reads, busy_timeout waits for a writer instead of failing with
+    "database is locked".
+
+    :param filepath: Path to the database file.
+    :param read_only: Whether to open the database read only.
+    :return: A sqlite3 Connection object, representing a database connection.
+    """
+    if read_only:
+        connection = sqlite3.connect(
+            f"{pathlib.Path(filepath).as_uri()}?mode=ro",
+            uri=True,
+            isolation_level="DEFERRED",
+            check_same_thread=False,
+        )
+    else:
+        # Writes manage their own transactions, see ``FileSystemCheckpointing._write``
+        connection = sqlite3.connect(
+            filepath, isolation_level=None, check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=5000")
+    connection.execute("PRAGMA temp_store=MEMORY")
+    connection.execute("PRAGMA cache_size=-20000")
+    return connection
+
+
+class _ConnectionPool:
+    """
+    Connections to one checkpoint database: a single writer, shared under a lock, and up to
+    ``max_readers`` idle readers kept for reuse. Readers are opened on first use.
+    """
+
+    def __init__(self, filepath: str, max_readers: int):
+        self._filepath = filepath
+        # Opening the writer creates the database file if needed, and the WAL index that read
+        # only connections can't create
+        self._writer: Optional[sqlite3.Connection] = _open_connection(filepath)
+        stat = os.stat(filepath)
+        self.identity = (stat.st_dev, stat.st_ino)
+        self._write_lock = threading.RLock()
+        # How many times the writer is currently held, by the thread holding the lock
+        self._write_depth = 0
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(
+            max_readers
+        )
+
+    def acquire_write(self) -> sqlite3.Connection:
+        """
+        Locks and returns the writer connection. Must be followed by ``release_write``.
+        """
+        self._write_lock.acquire()  # pylint: disable=consider-using-with
+        try:
+            if self._writer is None:
+                self._writer = _open_connection(self._filepath)
+        except BaseException:
+            self._write_lock.release()
+            raise
+        self._write_depth += 1
+        return self._writer
+
+    def release_write(self, commit: bool = True) -> None:
+        """
+        Unlocks the writer connection. When the outermost hold is released, a transaction left
+        open on it is committed, or rolled back if ``commit`` is false, so it can't keep the
+        database locked.
+        """
+        try:
+            self._write_depth -= 1
+            writer = self._writer
+            if self._write_depth == 0 and writer is not None and writer.in_transaction:
+                if commit:
+                    writer.commit()
+                else:
+                    writer.rollback()
+        finally:
+            self._write_lock.release()
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrows a reader connection, opening one if none are idle.
+        """
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            connection = _open_connection(self._filepath, read_only=True)
+        try:
+            yield connection
+        finally:
+            try:
+                self._readers.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+
+    def close(self) -> None:
+        """
+        Closes the writer and any idle readers.
+        """
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# Connection pools by (process id, filepath). The process id stops forked workers from using
+# their parent's connections.
+_POOLS: Dict[Tuple[int, str], _ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _get_pool(filepath: str) -> _ConnectionPool:
+    """
+    Gets this process's connection pool for the given database, creating it on first use.
+    """
+    # The file's identity is checked so a database that was deleted or replaced since the pool
+    # was created isn't written to through stale connections
+    try:
+        stat = os.stat(filepath)
+        identity: Optional[Tuple[int, int]] = (stat.st_dev, stat.st_ino)
+    except FileNotFoundError:
+        identity = None
+
+    pool_key = (os.getpid(), filepath)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(pool_key)
+        if pool is None or pool.identity != identity:
+            if pool is not None:
+                pool.close()
+            pool = _ConnectionPool(filepath, max_readers=os.cpu_count() or 1)
+            _POOLS[pool_key] = pool
+        return pool
+
+
+@atexit.register
+def _close_pools() -> None:
+    """
+    Closes this process's pooled connections, letting SQLite checkpoint and remove the WAL files.
+    """
+    with _POOLS_LOCK:
+        pool_keys = [pool_key for pool_key in _POOLS if pool_key[0] == os.getpid()]
+        for pool_key in pool_keys:
+            _POOLS.pop(pool_key).close()
+
+
+# Pools whose writer is held by ``FileSystemCheckpointing.__enter__``, per thread
+_HELD_POOLS = threading.local()
+
 
 class FileSystemCheckpointing:
     """
@@ -38,10 +227,22 @@ class FileSystemCheckpointing:
         :param filepath: A filepath to use for the database file.
         :param connection: A sqlite3 DB connection to use. Supplying this breaks parallelization.
         """
-        self._filepath = os.path.abspath(
-            filepath or tempfile.NamedTemporaryFile(suffix="_memento.checkpoint").name
-        )
+        self._filepath = _database_path(filepath, "_memento.checkpoint")
         self._table_name = "checkpoint_table"
+        self._sql_select = f"SELECT value FROM {self._table_name} WHERE key = ?"
+        self._sql_exists = f"SELECT 1 FROM {self._table_name} WHERE key = ? LIMIT 1"
+        self._sql_insert = (
+            f"INSERT OR REPLACE INTO {self._table_name}(key,value) VALUES(?,?)"
+        )
+        self._sql_delete = f"DELETE FROM {self._table_name} WHERE key = ?"
+        self._metrics_table_name = "checkpoint_metrics"
+        self._sql_insert_metric = (
+            f"INSERT INTO {self._metrics_table_name}(key,name,x,y) VALUES(?,?,?,?)"
+        )
+        self._sql_select_metrics = (
+            f"SELECT name, x, y FROM {self._metrics_table_name} WHERE key = ? ORDER BY rowid"
+        )
+        self._sql_delete_metrics = f"DELETE FROM {self._metrics_table_name} WHERE key = ?"
         self.key = key or default_key_provider
         self._connection = connection
 
@@ -55,12 +256,29 @@ class FileSystemCheckpointing:
             databases.execute(
                 f"""
                 CREATE TABLE IF NOT EXISTS {self._table_name} (
-                    key BINARY PRIMARY KEY,
+                    key BLOB PRIMARY KEY,
                     ts REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5)*86400.0),
                     value BLOB NOT NULL
                 ) WITHOUT ROWID
             """
             )
+            # Metric values flushed by ``Context.flush_metrics``
+            databases.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self._metrics_table_name} (
+                    key BLOB NOT NULL,
+                    name TEXT NOT NULL,
+                    x REAL NOT NULL,
+                    y REAL NOT NULL
+                )
+            """
+            )
+            databases.execute(
+                f"""
+                CREATE INDEX IF NOT EXISTS {self._metrics_table_name}_key
+                ON {self._metrics_table_name}(key)
+            """
+            )
 
     def __enter__(self) -> sqlite3.Connection:
         """
@@ -73,19 +291,49 @@ class FileSystemCheckpointing:
 
         :return: A sqlite3 Connection object, representing a database connection.
         """
-        return self._connection or sqlite3.Connection(
-            self._filepath, isolation_level="DEFERRED"
-        )
+        if self._connection is not None:
+            return self._connection
+        pool = _get_pool(self._filepath)
+        connection = pool.acquire_write()
+        _HELD_POOLS.__dict__.setdefault("pools", []).append(pool)
+        return connection
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         """
-        Run at the end of the `with _ as _` block
+        Run at the end of the `with _ as _` block. Returns the connection to its pool, committing
+        a transaction left open in the block, or rolling it back if the block raised.
         ...
             with File_System_Checkpointing_Object as database:
                 database.execute("some SQL")
 
         :return: Nothing.
         """
+        if self._connection is None:
+            _HELD_POOLS.pools.pop().release_write(commit=exc_type is None)
+
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrows a read only connection to the database, so reads don't wait for the writer.
+        """
+        if self._connection is not None:
+            yield self._connection
+            return
+        with _get_pool(self._filepath).read() as connection:
+            yield connection
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """
+        Runs the statements in the block in one ``BEGIN IMMEDIATE`` transaction. Taking the write
+        lock up front makes concurrent writers wait for each other (up to busy_timeout) instead of
+        failing when a deferred transaction can't be upgraded. Rolls back if the block raises.
+        """
+        with self as database:
+            if not database.in_transaction:
+                database.execute("BEGIN IMMEDIATE")
+            with database:
+                yield database
 
     def __str__(self) -> str:
         """
@@ -94,59 +342,126 @@ class FileSystemCheckpointing:
         """
         return f"Filesystem checkpoint, using {self._connection or self._filepath}"
 
-    def get(self, key: str):
+    def get(self, key: Key):
         """
         Gets the item in the checkpoint specified by the key.
         :param key: Used to get the item from the cache.
         :returns: The item in the checkpoint, if it exists.
         :raise KeyError: When the key has not been checkpoint.
         """
-        with self as database:
-            rows = database.execute(
-                f"SELECT value FROM {self._table_name} WHERE key = ?", (key,)
-            ).fetchall()
-            if rows:
-                return cloudpickle.loads(rows[0][0])[0]
+        with self._read() as database:
+            row = database.execute(self._sql_select, (_as_bytes(key),)).fetchone()
+            if row is not None:
+                # Copied into a bytearray so arrays in the checkpoint are restored writable
+                return _loads_item(bytearray(row[0]))[0]
 
-            raise KeyError(f"Key '{key}' not in checkpoint")
+            raise KeyError(f"Key {key!r} not in checkpoint")
 
-    def set(self, key: str, item) -> None:
+    def set(self, key: Key, item) -> None:
         """
         Checkpoint the item with a specified key.
         :param key: The location for the item in checkpoint.
         :param item: The item to be checkpoint.
         :returns: Nothing.
         """
-        with self as database:
-            database.execute(
-                f"INSERT OR REPLACE INTO {self._table_name}(key,value) VALUES(?,?)",
-                (key, cloudpickle.dumps(item)),
+        value = _dumps_item(item)
+        with self._write() as database:
+            database.execute(self._sql_insert, (_as_bytes(key), value))
+
+    def set_many(self, items: Dict[Key, Any]) -> None:
+        """
+        Checkpoint many items at once, using a single transaction.
+        :param items: The items to be checkpoint, by key.
+        :returns: Nothing.
+        """
+        # Serialized before the transaction starts, so the write lock is held only for the inserts
+        rows = [(_as_bytes(key), _dumps_item(item)) for key, item in items.items()]
+        if not rows:
+            return
+        with self._write() as database:
+            database.executemany(self._sql_insert, rows)
+
+    def add_metrics(
+        self,
+        key: Key,
+        rows: Iterable[Tuple[str, float, float]],
+        replace: bool = False,
+    ) -> None:
+        """
+        Stores metric values for a key, using a single transaction.
+        :param key: The key the metric values belong to.
+        :param rows: Tuples of (metric name, x value, y value).
+        :param replace: Whether to remove the values already stored for the key first.
+        :returns: Nothing.
+        """
+        key = _as_bytes(key)
+        with self._write() as database:
+            if replace:
+                database.execute(self._sql_delete_metrics, (key,))
+            database.executemany(
+                self._sql_insert_metric, ((key, name, x, y) for name, x, y in rows)
             )
-            database.commit()
 
-    def remove(self, key: str):
+    def get_metrics(self, key: Key) -> Dict[str, Tuple[array, array]]:
+        """
+        Gets the metric values stored for a key, in the order they were added.
+        :param key: The key the metric values belong to.
+        :returns: The x and y values of each metric, as columns.
+        """
+        metrics: Dict[str, Tuple[array, array]] = {}
+        with self._read() as database:
+            for name, x_value, y_value in database.execute(
+                self._sql_select_metrics, (_as_bytes(key),)
+            ):
+                columns = metrics.get(name)
+                if columns is None:
+                    columns = metrics[name] = (array("d"), array("d"))
+                columns[0].append(x_value)
+                columns[1].append(y_value)
+        return metrics
+
+    def remove(self, key: Key):
         """
-        Remove checkpoint by using key
+        Remove checkpoint, and any metric values stored for it, by using key
         :param key: Key of the checkpoint
         :returns: None
         """
-        with self as database:
-            database.execute(f"DELETE FROM {self._table_name} WHERE key = ?", (key,))
-            database.commit()
+        with self._write() as database:
+            database.execute(self._sql_delete, (_as_bytes(key),))
+            database.execute(self._sql_delete_metrics, (_as_bytes(key),))
 
-    def contains(self, key: str) -> bool:
+    def remove_many(self, keys: Sequence[Key]):
+        """
+        Remove the checkpoints of many keys at once, using a single transaction
+        :param keys: Keys of the checkpoints
+        :returns: None
+        """
+        if not keys:
+            return
+        keys = [_as_bytes(key) for key in keys]
+        with self._write() as database:
+            for batch in _batches(keys):
+                placeholders = ", ".join("?" * len(batch))
+                database.execute(
+                    f"DELETE FROM {self._table_name} WHERE key IN ({placeholders})",
+                    batch,
+                )
+                database.execute(
+                    f"DELETE FROM {self._metrics_table_name} WHERE key IN ({placeholders})",
+                    batch,
+                )
+
+    def contains(self, key: Key) -> bool:
         """
         Checks whether a key has been checkpoint.
         :param key: The key to check.
         :returns: True if it exists, False otherwise.
         """
-        try:
-            self.get(key)
-            return True
-        except KeyError:
-            return False
+        with self._read() as database:
+            row = database.execute(self._sql_exists, (_as_bytes(key),)).fetchone()
+            return row is not None
 
-    def make_key(self, *args, **kwargs) -> str:
+    def make_key(self, *args, **kwargs) -> Key:
         """
         Generates a key to be used in checkpointing.
         :param args: Arguments to the function to be checkpoint.
@@ -162,28 +477,59 @@ class Context:
     progress reporting, and more available to tasks.
     """
 
-    _metrics: Dict[str, List[Metric]]
+    # The x and y values of each metric, stored as columns
+    _metrics: Dict[str, Tuple[array, array]]
 
-    def __init__(self, key: str, checkpoint_provider: FileSystemCheckpointing):
+    def __init__(
+        self,
+        key: Key,
+        checkpoint_provider: FileSystemCheckpointing,
+        *,
+        clock: Callable[[], float] = time.time,
+    ):
         """
         Each context is associated with exactly one task.
 
         :param key: This is the key provided by memento for each task.
         :param checkpoint_provider: The checkpoint provider, defaults to FileSystemCheckpointing
+        :param clock: Returns the default x value of recorded metrics, defaults to
+            ``time.time``.
         """
-        self.key = key
+        self.key = _as_bytes(key)
+        self._clock = clock
         self._metrics = {}
+        # Whether metric values were moved to the checkpoint provider by ``flush_metrics``
+        self._flushed = False
         self._checkpoint_provider = checkpoint_provider
         self.checkpoint_key = None
 
-    def collect_metrics(self) -> Dict[str, pd.DataFrame]:
+    def collect_metrics(self) -> Dict[str, "pd.DataFrame"]:
         """
         Collects all of the metrics as dataframes.
         :return: A dictionary of metric names that map to Pandas Dataframes.
         """
-        metrics: Dict[str, DataFrame] = {}
-        for name in self._metrics:
-            metrics[name] = pd.DataFrame(self._metrics[name])
+        metrics: Dict[str, "pd.DataFrame"] = {}
+        columns = self._metrics
+        if self._flushed:
+            columns = self._checkpoint_provider.get_metrics(self.key)
+            for name, (x_values, y_values) in self._metrics.items():
+                if name in columns:
+                    columns[name][0].extend(x_values)
+                    columns[name][1].extend(y_values)
+                else:
+                    columns[name] = (x_values, y_values)
+        if not columns:
+            return metrics
+
+        # pylint: disable=import-outside-toplevel
+        import numpy as np
+        import pandas as pd
+
+        for name, (x_values, y_values) in columns.items():
+            # Copied, a view would stop the arrays from growing if more values are recorded
+            metrics[name] = pd.DataFrame(
+                dict(zip(Metric._fields, (np.array(x_values), np.array(y_values))))
+            )
 
         return metrics
 
@@ -203,26 +549,52 @@ class Context:
         :return: None.
         :param value_dict:
         """
-        x_value = time.time()
-
-        for name in value_dict:
-            y_value = value_dict[name]
+        timestamp = self._clock()
+        metrics = self._metrics
 
+        for name, value in value_dict.items():
             # Handles the case of a tuple
-            if isinstance(y_value, tuple):
-                y_value = cast(Tuple[float, float], y_value)
-                x_value = y_value[0]
-                y_value = y_value[1]
-
-            # Type guards that shouldn't be triggered.
-            assert isinstance(x_value, float)
-            assert isinstance(y_value, float)
-
-            metric = Metric(x_value, y_value)
-            if self._metrics.get(name, False):
-                self._metrics[name].append(metric)
+            if isinstance(value, tuple):
+                x_value, y_value = value
             else:
-                self._metrics[name] = [metric]
+                x_value, y_value = timestamp, value
+
+            columns = metrics.get(name)
+            if columns is None:
+                columns = metrics[name] = (array("d"), array("d"))
+
+            # The arrays raise TypeError for values that aren't numbers
+            columns[0].append(x_value)
+            try:
+                columns[1].append(y_value)
+            except TypeError:
+                columns[0].pop()
+                raise
+
+    def flush_metrics(self, batch_size: int = 1000) -> None:
+        """
+        Moves the metric values recorded so far to the checkpoint provider once at least
+        ``batch_size`` of them are held in memory, writing them in one transaction. Long running
+        tasks can call this regularly to bound the memory their metrics use. Flushed values are
+        still returned by ``collect_metrics``.
+
+        :param batch_size: The number of recorded values needed before they're written.
+        """
+        if sum(len(x_values) for x_values, _ in self._metrics.values()) < batch_size:
+            return
+        # Values left by an earlier attempt at the task that failed are replaced by the first
+        # flush, so they aren't mixed into this attempt's metrics
+        self._checkpoint_provider.add_metrics(
+            self.key,
+            (
+                (name, x_value, y_value)
+                for name, (x_values, y_values) in self._metrics.items()
+                for x_value, y_value in zip(x_values, y_values)
+            ),
+            replace=not self._flushed,
+        )
+        self._metrics = {}
+        self._flushed = True
 
     def progress(self, delta, total=None):  # pylint: disable=no-self-use
         """
@@ -277,7 +649,7 @@ class Result:
 
     inner: Any
 
-    metrics: Dict[str, pd.DataFrame]
+    metrics: Dict[str, "pd.DataFrame"]
 
     "The start time of the task."
     start_time: datetime.datetime
@@ -296,7 +668,7 @@ class Result:
         self,
         config,
         inner,
-        metrics: Dict[str, pd.DataFrame],
+        metrics: Dict[str, "pd.DataFrame"],
         start_time: datetime.datetime,
         runtime: datetime.timedelta,
         cpu_time: Optional[datetime.timedelta],
@@ -1,16 +1,24 @@
+import gc
+import pickle
+import sys
 import time
 import os
 import tempfile
 import hashlib
+import weakref
+from collections import OrderedDict
 from sqlite3 import Connection
 from unittest.mock import Mock
 import pytest
 import cloudpickle
+import numpy as np
+from memento import caching
 from memento.caching import (
     Cache,
     MemoryCacheProvider,
     CacheProvider,
     FileSystemCacheProvider,
+    default_key_provider,
 )
 from memento.parallel import TaskManager, delayed
 
@@ -19,7 +27,7 @@ class TestCache:
     def test_cache_calls_underlying_function_when_not_in_cache(self):
         underlying_func = Mock()
         cache_provider = Mock(spec_set=CacheProvider)
-        cache_provider.get.side_effect = KeyError()
+        cache_provider.contains.return_value = False
 
         cached = Cache(underlying_func, cache_provider)
         cached({"key1": "value1"})
@@ -41,7 +49,7 @@ class TestCache:
         underlying_func = Mock(return_value=result)
         cache_provider = Mock(spec_set=CacheProvider)
         cache_provider.make_key.return_value = cache_key
-        cache_provider.get.side_effect = KeyError()
+        cache_provider.contains.return_value = False
 
         cached_function = Cache(underlying_func, cache_provider=cache_provider)
 
@@ -49,6 +57,16 @@ class TestCache:
 
         cache_provider.set.assert_called_once_with(cache_key, result)
 
+    def test_cache_does_not_get_from_cache_when_not_contained(self):
+        underlying_func = Mock(return_value="result")
+        cache_provider = Mock(spec_set=CacheProvider)
+        cache_provider.contains.return_value = False
+
+        cached_function = Cache(underlying_func, cache_provider=cache_provider)
+
+        assert cached_function() == "result"
+        cache_provider.get.assert_not_called()
+
     def test_cache_creates_file_system_cache_provider_by_default(self):
         cache = Cache(lambda x: x + 1)
         assert isinstance(cache._cache_provider, FileSystemCacheProvider)
@@ -56,7 +74,7 @@ class TestCache:
     def test_cache_force_cache(self):
         underlying_func = Mock()
         cache_provider = Mock(spec_set=CacheProvider)
-        cache_provider.get.side_effect = KeyError()
+        cache_provider.contains.return_value = False
 
         cached = Cache(underlying_func, cache_provider)
         with pytest.raises(KeyError):
@@ -77,6 +95,172 @@ class TestCache:
 
         assert first == second and second != third
 
+    @pytest.mark.parametrize("result", [False, None, 0])
+    @pytest.mark.parametrize(
+        "cache_provider", [MemoryCacheProvider, FileSystemCacheProvider]
+    )
+    def test_cache_returns_cached_falsy_results(self, cache_provider, result):
+        calls = []
+
+        def func(x):
+            calls.append(x)
+            return result
+
+        cached_function = Cache(func, cache_provider=cache_provider())
+
+        assert cached_function(1) is result
+        assert cached_function(1) is result
+        assert cached_function(1, force_cache=True) is result
+        assert calls == [1]
+
+    def test_cache_force_run_does_not_check_cache(self):
+        underlying_func = Mock(return_value="result")
+        cache_provider = Mock(spec_set=CacheProvider)
+
+        cached_function = Cache(underlying_func, cache_provider=cache_provider)
+
+        assert cached_function(force_run=True) == "result"
+        cache_provider.contains.assert_not_called()
+        cache_provider.get.assert_not_called()
+
+
+class TestDefaultKeyProvider:
+    def test_default_key_provider_pickles_function_once(self, monkeypatch):
+        pickled = []
+        hash_pickle = caching._hash_pickle
+
+        def recording_hash_pickle(obj, prefix=b""):
+            pickled.append(obj)
+            return hash_pickle(obj, prefix)
+
+        monkeypatch.setattr(caching, "_hash_pickle", recording_hash_pickle)
+
+        def function(x):
+            return x
+
+        first = default_key_provider(function, 1)
+        second = default_key_provider(function, 2)
+
+        assert first != second
+        assert first == default_key_provider(function, 1)
+        assert pickled.count(function) == 1
+
+    def test_default_key_provider_distinguishes_functions(self):
+        assert default_key_provider(len, [1]) != default_key_provider(sum, [1])
+
+    def test_default_key_provider_remembers_keys_of_immutable_arguments(
+        self, monkeypatch
+    ):
+        def function(x):
+            return x
+
+        first = default_key_provider(function, 1, y=("a", None))
+        monkeypatch.setattr(caching, "_hash_pickle", Mock(side_effect=AssertionError))
+
+        assert default_key_provider(function, 1, y=("a", None)) == first
+
+    def test_default_key_provider_evicts_least_recently_used_keys(self, monkeypatch):
+        monkeypatch.setattr(caching, "_KEYS", OrderedDict())
+        monkeypatch.setattr(caching, "_MAX_KEYS", 2)
+
+        def function(x):
+            return x
+
+        default_key_provider(function, 1)
+        default_key_provider(function, 2)
+        default_key_provider(function, 1)
+        default_key_provider(function, 3)
+
+        assert [signature for _, signature in caching._KEYS] == [
+            caching._immutable_signature(((x,), ())) for x in (1, 3)
+        ]
+
+    def test_default_key_provider_does_not_keep_functions_alive(self):
+        def function(x):
+            return x
+
+        default_key_provider(function, 1)
+        reference = weakref.ref(function)
+        del function
+        gc.collect()
+
+        assert reference() is None
+
+    @pytest.mark.parametrize("args", [("a", 1, 2.5, True, None), ([1, 2], {"a": 1})])
+    def test_default_key_provider_keys_match_cloudpickled_arguments(self, args):
+        def function(*args):
+            return args
+
+        fingerprint = hashlib.blake2b(
+            cloudpickle.dumps(function, protocol=5), digest_size=16
+        ).digest()
+        expected = hashlib.blake2b(
+            fingerprint
+            + cloudpickle.dumps({"args": args, "kwargs": {"b": 2}}, protocol=5),
+            digest_size=16,
+        ).digest()
+
+        assert default_key_provider(function, *args, b=2) == expected
+
+    def test_default_key_provider_skips_cloudpickle_for_immutable_arguments(
+        self, monkeypatch
+    ):
+        def function(x):
+            return x
+
+        default_key_provider(function, 1)
+        monkeypatch.setattr(
+            cloudpickle, "CloudPickler", Mock(side_effect=AssertionError)
+        )
+
+        assert default_key_provider(function, 2) != default_key_provider(function, 3)
+
+    @pytest.mark.parametrize(
+        "first,second", [(1, 1.0), (1, True), (0.0, -0.0), ((1,), (1.0,))]
+    )
+    def test_default_key_provider_distinguishes_equal_arguments(self, first, second):
+        def function(x):
+            return x
+
+        assert default_key_provider(function, first) == default_key_provider(
+            function, first
+        )
+        assert default_key_provider(function, first) != default_key_provider(
+            function, second
+        )
+
+
+class TestPickleItem:
+    def test_pickle_item_uses_pickle_for_plain_items(self, monkeypatch):
+        monkeypatch.setattr(cloudpickle, "dumps", Mock(side_effect=AssertionError))
+        item = {"scores": np.arange(10), "name": "test"}
+
+        data, buffers = caching._pickle_item(item)
+
+        assert len(buffers) == 1
+        loaded = pickle.loads(data, buffers=buffers)
+        assert loaded["name"] == "test"
+        assert np.array_equal(loaded["scores"], item["scores"])
+
+    def test_pickle_item_falls_back_to_cloudpickle(self):
+        data, _ = caching._pickle_item(lambda x: x + 1)
+
+        assert pickle.loads(data)(1) == 2
+
+    def test_pickle_item_uses_cloudpickle_for_main_references(self, monkeypatch):
+        class MainClass:
+            __module__ = "__main__"
+            __qualname__ = "MainClass"
+
+        monkeypatch.setattr(
+            sys.modules["__main__"], "MainClass", MainClass, raising=False
+        )
+
+        data, _ = caching._pickle_item(MainClass())
+
+        monkeypatch.delattr(sys.modules["__main__"], "MainClass")
+        assert type(pickle.loads(data)).__name__ == "MainClass"
+
 
 class TestMemoryCacheProvider:
     def test_memory_cache_provider_get_works_when_data_in_cache(self):
@@ -109,17 +293,17 @@ class TestMemoryCacheProvider:
 
         arguments = ("test1", "test2", 123, True)
         keyword_arguments = {
-            "key1": "value1",
             "key2": "value2",
+            "key1": "value1",
             "key3": 321,
             "key4": False,
         }
-        expected = cloudpickle.dumps(
-            {
-                "function": function,
-                "args": arguments,
-                "kwargs": keyword_arguments,
-            }
+        expected = (
+            function,
+            arguments,
+            (("key1", "value1"), ("key2", "value2"), ("key3", 321), ("key4", False)),
+            (str, str, int, bool),
+            (str, str, int, bool),
         )
 
         provider = MemoryCacheProvider()
@@ -127,6 +311,44 @@ class TestMemoryCacheProvider:
 
         assert expected == actual
 
+    def test_memory_cache_provider_distinguishes_argument_types(self):
+        provider = MemoryCacheProvider()
+        assert provider.make_key(len, 1) != provider.make_key(len, True)
+
+    def test_memory_cache_provider_distinguishes_nested_argument_types(self):
+        def function(x):
+            return x
+
+        cached_function = Cache(function, cache_provider=MemoryCacheProvider())
+
+        results = [
+            cached_function((1,)),
+            cached_function((1.0,)),
+            cached_function((True,)),
+        ]
+
+        assert [type(result[0]) for result in results] == [int, float, bool]
+        assert cached_function(frozenset([1.0])) == {1.0}
+        assert type(next(iter(cached_function(frozenset([True]))))) is bool
+
+    def test_memory_cache_provider_distinguishes_float_values(self):
+        provider = MemoryCacheProvider()
+
+        assert provider.make_key(abs, 0.0) != provider.make_key(abs, -0.0)
+        assert provider.make_key(abs, x=0.0) != provider.make_key(abs, x=-0.0)
+        assert provider.make_key(abs, float("nan")) == provider.make_key(
+            abs, float("nan")
+        )
+
+    def test_memory_cache_provider_pickles_unhashable_arguments(self):
+        def function(*args):
+            return args
+
+        provider = MemoryCacheProvider()
+        actual = provider.make_key(function, [1, 2], key={"a": 1})
+
+        assert actual == default_key_provider(function, [1, 2], key={"a": 1})
+
     def test_memory_cache_provider_raises_key_error_when_key_not_in_cache(self):
         provider = MemoryCacheProvider()
         with pytest.raises(KeyError) as error_info:
@@ -154,7 +376,7 @@ class TestFileSystemCacheProvider:
         path = f"memento_cache/{hashlib.sha256(b'key').hexdigest()}.pkl"
         with open(path, "wb") as test_file:
             cloudpickle.dump("value", test_file)
-        connection.execute().fetchall.return_value = [[path]]
+        connection.execute().fetchone.return_value = (path,)
         provider = FileSystemCacheProvider(connection=connection)
 
         value = provider.get("key")
@@ -176,14 +398,14 @@ class TestFileSystemCacheProvider:
         path = f"memento_cache/{hashlib.sha256(b'key').hexdigest()}.pkl"
         with open(path, "wb") as test_file:
             cloudpickle.dump("value", test_file)
-        connection.execute().fetchall.return_value = [[path]]
+        connection.execute().fetchone.return_value = (1,)
         provider = FileSystemCacheProvider(connection=connection)
 
         assert provider.contains("key") is True
 
     def test_file_system_cache_provider_contains_works_when_key_not_in_file(self):
         connection = Mock(spec_set=Connection)
-        connection.execute().fetchall.return_value = None
+        connection.execute().fetchone.return_value = None
         provider = FileSystemCacheProvider(connection=connection)
 
         assert provider.contains("not_in_cache") is False
@@ -199,13 +421,16 @@ class TestFileSystemCacheProvider:
             "key3": 321,
             "key4": False,
         }
-        expected = cloudpickle.dumps(
-            {
-                "function": function,
-                "args": arguments,
-                "kwargs": keyword_arguments,
-            }
-        )
+        fingerprint = hashlib.blake2b(
+            cloudpickle.dumps(function, protocol=5), digest_size=16
+        ).digest()
+        expected = hashlib.blake2b(
+            fingerprint
+            + cloudpickle.dumps(
+                {"args": arguments, "kwargs": keyword_arguments}, protocol=5
+            ),
+            digest_size=16,
+        ).digest()
 
         connection = Mock(spec_set=Connection)
         provider = FileSystemCacheProvider(connection)
@@ -217,7 +442,7 @@ class TestFileSystemCacheProvider:
         self,
     ):
         connection = Mock(spec_set=Connection)
-        connection.execute().fetchall.return_value = None
+        connection.execute().fetchone.return_value = None
         provider = FileSystemCacheProvider(connection=connection)
         with pytest.raises(KeyError) as error_info:
             provider.get("not_in_cache")
@@ -231,12 +456,73 @@ class TestFileSystemCacheProvider:
         assert provider.get("test_key1") == "test_value3"
         assert provider.get("test_key2") == "test_value2"
 
+    def test_file_system_cache_provider_set_many_then_gets_from_file(self):
+        provider = FileSystemCacheProvider(filepath=self._filepath)
+        provider.set_many([("test_key1", "test_value1"), ("test_key2", "test_value2")])
+
+        assert provider.get("test_key1") == "test_value1"
+        assert provider.get("test_key2") == "test_value2"
+
+    def test_file_system_cache_provider_contains_many_then_get_many(self):
+        provider = FileSystemCacheProvider(filepath=self._filepath)
+        provider.set_many([(b"key1", "value1"), (b"key2", "value2")])
+
+        found = provider.contains_many([b"key1", b"key2", b"not_in_cache"])
+
+        assert found == {b"key1", b"key2"}
+        assert provider.get_many([b"key2", b"key1"]) == ["value2", "value1"]
+        with pytest.raises(KeyError):
+            provider.get_many([b"key1", b"not_in_cache"])
+
+    def test_file_system_cache_provider_sets_then_gets_arrays_to_file(self):
+        provider = FileSystemCacheProvider(filepath=self._filepath)
+        array = np.arange(20, dtype=np.float64).reshape(4, 5)
+        provider.set("key", {"array": array, "transposed": array.T})
+
+        value = provider.get("key")
+
+        assert np.array_equal(value["array"], array)
+        assert np.array_equal(value["transposed"], array.T)
+        assert value["array"].flags.writeable
+
+    def test_file_system_cache_provider_sets_then_gets_bare_array_to_file(self):
+        provider = FileSystemCacheProvider(filepath=self._filepath)
+        array = np.linspace(0, 1, 20)
+        objects = np.array([1, "a"], dtype=object)
+        provider.set("key1", array)
+        provider.set("key2", objects)
+
+        value = provider.get("key1")
+
+        assert type(value) is np.ndarray
+        assert np.array_equal(value, array)
+        assert value.flags.writeable
+        assert list(provider.get("key2")) == [1, "a"]
+
+    def test_file_system_cache_provider_sets_up_database_once(self, monkeypatch):
+        created = []
+        create_table = FileSystemCacheProvider._create_table
+
+        def recording_create_table(provider):
+            created.append(provider)
+            create_table(provider)
+
+        monkeypatch.setattr(
+            FileSystemCacheProvider, "_create_table", recording_create_table
+        )
+
+        FileSystemCacheProvider(filepath=self._filepath).set("key", "value")
+        provider = FileSystemCacheProvider(filepath=self._filepath)
+
+        assert len(created) == 1
+        assert provider.get("key") == "value"
+
     def test_file_system_cache_provider_does_not_close_supplied_connection(self):
         connection = Mock(spec_set=Connection)
         path = f"memento_cache/{hashlib.sha256(b'key').hexdigest()}.pkl"
         with open(path, "wb") as test_file:
             cloudpickle.dump("value", test_file)
-        connection.execute().fetchall.return_value = [[path]]
+        connection.execute().fetchone.return_value = (path,)
         provider = FileSystemCacheProvider(connection=connection)
 
         provider.set("key", "value")
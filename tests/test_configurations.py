@@ -1,4 +1,8 @@
-from memento.configurations import generate_configurations
+import numpy as np
+import pytest
+
+from memento import configurations
+from memento.configurations import Config, generate_configurations
 
 
 def test_configurations_no_exclude():
@@ -85,5 +89,109 @@ def test_configurations_multi_steps():
         assert config.asdict() == expected
 
 
+def test_configurations_exclude_unhashable_values():
+    matrix = {
+        "parameters": {"param1": [[1], [2]], "param2": [{"a": 3}, 4]},
+        "exclude": [{"param1": [2], "param2": 4}, {"param2": {"a": 3}, "param1": [1]}],
+    }
+
+    configs = generate_configurations(matrix)
+    expected = [
+        {"param1": [1], "param2": 4},
+        {"param1": [2], "param2": {"a": 3}},
+    ]
+
+    assert len(configs) == len(expected)
+
+    for config, expected in zip(configs, expected):
+        assert config.asdict() == expected
+
+
+def test_configurations_exclude_single_and_unknown_parameters():
+    matrix = {
+        "parameters": {"param1": [1, 2, 3], "param2": [4, 5]},
+        "exclude": [{"param2": 5}, {"param1": 1, "param3": 4}, {"param1": 3}],
+    }
+
+    configs = generate_configurations(matrix)
+
+    assert [config.asdict() for config in configs] == [
+        {"param1": 1, "param2": 4},
+        {"param1": 2, "param2": 4},
+    ]
+
+
+def test_configurations_exclude_single_parameters_before_product(monkeypatch):
+    matched = []
+    matches = configurations._Exclusions.matches
+
+    def recording_matches(self, element):
+        matched.append(element)
+        return matches(self, element)
+
+    monkeypatch.setattr(configurations._Exclusions, "matches", recording_matches)
+    matrix = {
+        "parameters": {"param1": [1, [2], 3], "param2": [4, 5]},
+        "exclude": [{"param1": 3}, {"param1": 1, "param2": 5}],
+    }
+
+    configs = generate_configurations(matrix)
+
+    assert [config.asdict() for config in configs] == [
+        {"param1": 1, "param2": 4},
+        {"param1": [2], "param2": 4},
+        {"param1": [2], "param2": 5},
+    ]
+    assert matched == [(1, 4), (1, 5), ([2], 4), ([2], 5)]
+
+
+def test_configurations_are_generated_lazily():
+    matrix = {
+        "parameters": {"param1": [1, 2], "param2": [3, 4]},
+        "settings": {"setting": 5},
+    }
+
+    configs = generate_configurations(matrix)
+    first = next(iter(configs))
+
+    assert first.asdict() == {"param1": 1, "param2": 3}
+    assert first.settings == {"setting": 5}
+    assert len(configs._configurations) == 1
+    assert configs[2].asdict() == {"param1": 2, "param2": 3}
+    assert len(configs) == 4
+    assert [config.asdict() for config in configs] == [
+        config.asdict() for config in configs
+    ]
+
+
+def test_config_parameters_are_attributes():
+    config = Config(param1=1, asdict=2)
+
+    assert config.param1 == 1
+    assert config.asdict() == {"param1": 1, "asdict": 2}
+    with pytest.raises(AttributeError):
+        _ = config.param2
+
+
+def test_config_parameters_do_not_overwrite_internal_attributes():
+    config = Config(_dict=1, _hash=2, param1=3)
+
+    assert config.param1 == 3
+    assert config.asdict() == {"_dict": 1, "_hash": 2, "param1": 3}
+    assert config == Config(_dict=1, _hash=2, param1=3)
+    assert hash(config) == hash(Config(_dict=1, _hash=2, param1=3))
+
+
+def test_config_compares_arrays_by_value():
+    config1 = Config(param1=np.arange(5), param2=[1, 2])
+    config2 = Config(param1=np.arange(5), param2=[1, 2])
+    config3 = Config(param1=np.arange(6), param2=[1, 2])
+
+    assert config1 == config2
+    assert config1 != config3
+    assert hash(config1) == hash(config2)
+    assert len({config1, config2, config3}) == 2
+
+
 if __name__ == "__main__":
     test_configurations()
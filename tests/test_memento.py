@@ -3,6 +3,9 @@ import tempfile
 
 import pytest
 
+from memento import memento as memento_module
+from memento.configurations import generate_configurations
+from memento.exceptions import CacheMiss, CyclicDependency
 from memento.memento import Memento
 from memento.notifications import FileSystemNotificationProvider
 
@@ -119,6 +122,59 @@ class TestMemento:
         results_3 = results[3]
         assert [result.inner["k1"] for result in results_3] == [4, 5, 6]
 
+    def test_key_provider_returns_short_keys(self):
+        configs = list(generate_configurations({"parameters": {"k1": ["a" * 10000, "b"]}}))
+
+        keys = [memento_module._key_provider(expensive_thing, config) for config in configs]
+
+        assert [len(key) for key in keys] == [16, 16]
+        assert keys[0] != keys[1]
+        assert keys[0] == memento_module._key_provider(expensive_thing, configs[0])
+        assert keys[0] != memento_module._key_provider(expensive_thing2, configs[0])
+
+    def test_force_cache_raises_on_first_cache_miss(self, monkeypatch):
+        def func(context, config):
+            raise Exception("should not be called")
+
+        keyed = []
+        key_provider = memento_module._key_provider
+
+        def recording_key_provider(func, config):
+            keyed.append(config)
+            return key_provider(func, config)
+
+        monkeypatch.setattr(memento_module, "_LOOKUP_BATCH_SIZE", 2)
+        monkeypatch.setattr(memento_module, "_key_provider", recording_key_provider)
+        matrix = {"parameters": {"k1": list(range(10))}}
+
+        with pytest.raises(CacheMiss):
+            Memento(func).run(matrix, cache_path=self._cache_filepath, force_cache=True)
+        assert len(keyed) == 2
+
+    def test_execution_order_groups_independent_matrices(self):
+        memento = Memento(expensive_thing)
+        memento.add_matrix({"id": 2, "dependencies": [1], "parameters": {"k1": ["a"]}})
+        memento.add_matrix({"id": 1, "dependencies": [], "parameters": {"k1": [1]}})
+        memento.add_matrix({"id": 3, "dependencies": [], "parameters": {"k1": [4]}})
+
+        waves, dependants = memento._get_execution_order()
+
+        assert [sorted(matrix["id"] for matrix in wave) for wave in waves] == [[1, 3], [2]]
+        assert {id_: [matrix["id"] for matrix in mats] for id_, mats in dependants.items()} == {
+            1: [2],
+            2: [],
+            3: [],
+        }
+
+    def test_execution_order_raises_on_cyclic_dependency(self):
+        memento = Memento(expensive_thing)
+        memento.add_matrix({"id": 1, "dependencies": [2], "parameters": {"k1": [1]}})
+        memento.add_matrix({"id": 2, "dependencies": [1], "parameters": {"k1": [2]}})
+        memento.add_matrix({"id": 3, "dependencies": [], "parameters": {"k1": [3]}})
+
+        with pytest.raises(CyclicDependency):
+            memento._get_execution_order()
+
     def test_run_multiple_dry(self):
         def func(context, config):
             raise Exception("should not be called")
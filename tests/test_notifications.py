@@ -1,18 +1,24 @@
 import email
+import gc
 import smtplib
+import socket
 from email.utils import parseaddr
 from io import StringIO
-from typing import List
+from typing import List, Optional
 from unittest.mock import Mock
 
+import cloudpickle
 import pytest
 from aiosmtpd import controller, handlers
 
+from memento import notifications
 from memento.notifications import (
     FileSystemNotificationProvider,
     EmailNotificationProvider,
+    BatchEmailNotificationProvider,
     SmtpConfiguration,
 )
+from memento.exceptions import AggregateException
 from memento.parallel import TaskManager, delayed
 
 
@@ -33,6 +39,27 @@ class TestFileSystemNotificationProvider:
         self.provider.task_failure()
         assert self.file.getvalue() == "Task failed\n"
 
+    def test_reuses_file_opened_from_path(self, tmp_path):
+        filepath = str(tmp_path / "notifications.txt")
+        provider = FileSystemNotificationProvider(filepath=filepath)
+
+        provider.task_completed()
+        file = provider._opened_file
+        provider.all_tasks_completed()
+        unpickled = cloudpickle.loads(cloudpickle.dumps(provider))
+        unpickled.task_failure()
+
+        assert provider._opened_file is file
+        with open(filepath) as f:
+            assert f.readlines() == [
+                "Task completed\n",
+                "All tasks completed\n",
+                "Task failed\n",
+            ]
+        provider.close()
+        unpickled.close()
+        assert file.closed
+
 
 class Handler(handlers.Message):
     def __init__(self, *args, **kwargs):
@@ -51,13 +78,25 @@ class Handler(handlers.Message):
         return self._messages
 
 
+def _free_port() -> int:
+    """
+    Returns an unused local port, so servers started by concurrent test runs, such as
+    pytest-xdist workers, don't collide on a fixed port.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
 class DummySmtpServer:
     """Dummy SMTP server that saves emails to a list. Primarily for testing/debugging."""
 
     def __init__(self):
         self._messages = []
         self._handler = Handler()
-        self._controller = controller.Controller(self._handler)
+        self._controller = controller.Controller(
+            self._handler, hostname="127.0.0.1", port=_free_port()
+        )
 
     def __enter__(self):
         self._controller.start()
@@ -93,6 +132,14 @@ class DummySmtpServer:
         self._controller.stop()
 
 
+class RecordingSmtp(smtplib.SMTP):
+    """SMTP client that saves sent messages to a list instead of connecting to a server."""
+
+    def __init__(self, messages: List[email.message.Message]):
+        super().__init__()
+        self.send_message = messages.append
+
+
 @pytest.mark.parametrize(
     "to_addrs",
     [
@@ -103,8 +150,7 @@ class DummySmtpServer:
 class TestEmailNotificationProvider:
     def setup_provider(self, to_addrs: List[str]):
         self.messages: List[email.message.Message] = []
-        self.client = Mock(spec_set=smtplib.SMTP)
-        self.client.send_message.side_effect = self.messages.append
+        self.client = RecordingSmtp(self.messages)
         self.from_addr = "sender@text.com"
         self.to_addrs = to_addrs
         self.provider = EmailNotificationProvider(
@@ -149,14 +195,120 @@ class TestEmailNotificationProvider:
         payload = "Task failed"
         self._check_messages(subject, payload)
 
+    def test_sends_every_email_to_addresses_given_as_iterator(self, to_addrs):
+        self.setup_provider(to_addrs)
+        self.provider = EmailNotificationProvider(
+            self.client, self.from_addr, iter(to_addrs)
+        )
+        self.provider.task_completed()
+        self.provider.task_failure()
+
+        assert len(self.messages) == 2
+        self._check_message(
+            self.messages[0], "[Memento] Task completed", "Task completed"
+        )
+        self._check_message(self.messages[1], "[Memento] Task failed", "Task failed")
+
+
+class FailingSmtp(smtplib.SMTP):
+    """SMTP client that refuses messages with the given subject and saves the others."""
+
+    def __init__(self, messages: List[email.message.Message], subject: Optional[str]):
+        super().__init__()
+        self.messages = messages
+        self.subject = subject
+
+    def send_message(self, msg, *args, **kwargs):
+        if msg["subject"] == self.subject:
+            raise smtplib.SMTPDataError(554, b"Rejected")
+        self.messages.append(msg)
+
+
+class TestBatchEmailNotificationProvider:
+    def setup_method(self):
+        self.messages: List[email.message.Message] = []
+        self.client = FailingSmtp(self.messages, "[Memento] Task failed")
+        self.provider = BatchEmailNotificationProvider(
+            self.client, "sender@test.com", ["receiver@test.com"]
+        )
+
+    def teardown_method(self):
+        self.provider._errors.clear()
+        self.provider.close()
+
+    def test_failed_message_does_not_stop_the_rest_of_its_batch(self):
+        self.provider.task_completed()
+        self.provider.task_failure()
+        self.provider.all_tasks_completed()
+
+        with pytest.raises(smtplib.SMTPDataError):
+            self.provider.flush()
+
+        assert [message["subject"] for message in self.messages] == [
+            "[Memento] Task completed",
+            "[Memento] All tasks completed",
+        ]
+
+    def test_close_raises_send_errors(self):
+        self.provider.task_failure()
+
+        with pytest.raises(smtplib.SMTPDataError):
+            self.provider.close()
+
+    def test_sender_stops_when_provider_is_garbage_collected(self):
+        provider = BatchEmailNotificationProvider(
+            RecordingSmtp(self.messages), "sender@test.com", ["receiver@test.com"]
+        )
+        provider.task_completed()
+        provider.flush()
+        sender = provider._sender
+
+        del provider
+        gc.collect()
+        sender.join(timeout=5)
+
+        assert not sender.is_alive()
+        assert len(self.messages) == 1
+
+    def test_task_manager_flushes_notifications(self):
+        self.client.subject = None
+        manager = TaskManager(
+            notification_provider=self.provider, notify_on_complete=True, workers=1
+        )
+        manager.add_task(delayed(lambda: None)())
+
+        manager.run()
+
+        assert len(self.messages) == 2
+
+    def test_task_manager_raises_send_errors(self):
+        manager = TaskManager(notification_provider=self.provider, workers=1)
+        manager.add_task(delayed(lambda: None)())
+        manager.add_task(delayed(lambda: 1 / 0)())
+
+        with pytest.raises(AggregateException) as error_info:
+            manager.run()
+
+        assert isinstance(error_info.value.__context__, smtplib.SMTPDataError)
+
+
+@pytest.fixture(scope="class")
+def smtp_server():
+    """A DummySmtpServer shared by the tests of a class, clear its messages before each test."""
+    server = DummySmtpServer()
+    server.start()
+    yield server
+    server.stop()
+
 
 @pytest.mark.slow
 class TestEmailNotificationProviderWithServer:
     """Tests to verify that emails are delivered to the SMTP server."""
 
-    def setup_method(self):
-        self.server = DummySmtpServer()
-        self.server.start()
+    @pytest.fixture(autouse=True)
+    def setup_provider(self, smtp_server: DummySmtpServer):
+        self.server = smtp_server
+        self.server.messages.clear()
 
         self.from_addr = "sender@text.com"
         self.to_addrs = ["receiver@test.com"]
@@ -168,9 +320,8 @@ class TestEmailNotificationProviderWithServer:
         self.provider = EmailNotificationProvider(
             smtp_config, self.from_addr, self.to_addrs
         )
-
-    def teardown_method(self):
-        self.server.stop()
+        yield
+        self.provider.close()
 
     def test_sends_email_to_server_on_task_completed(self):
         self.provider.task_completed()
@@ -184,6 +335,81 @@ class TestEmailNotificationProviderWithServer:
         self.provider.task_failure()
         assert len(self.server.messages) == 1
 
+    def test_reuses_connection_to_server(self):
+        self.provider.task_completed()
+        connection = self.provider._connection
+        self.provider.task_completed()
+
+        assert self.provider._connection is connection
+        assert len(self.server.messages) == 2
+        self.provider.close()
+
+    def test_reuses_connection_for_many_notifications(self, monkeypatch):
+        connect = Mock(wraps=self.provider._connect)
+        monkeypatch.setattr(self.provider, "_connect", connect)
+
+        for _ in range(50):
+            self.provider.task_completed()
+
+        assert connect.call_count == 1
+        assert len(self.server.messages) == 50
+        self.provider.close()
+
+    def test_replaces_idle_connection(self):
+        self.provider.task_completed()
+        connection = self.provider._connection
+
+        self.provider._last_sent -= notifications._MAX_IDLE_SECONDS + 1
+        self.provider.task_completed()
+
+        assert self.provider._connection is not connection
+        assert len(self.server.messages) == 2
+        self.provider.close()
+
+    def test_reconnects_to_server_when_disconnected(self):
+        self.provider.task_completed()
+        self.provider._connection.close()
+        self.provider.task_completed()
+
+        assert len(self.server.messages) == 2
+        self.provider.close()
+
+    def test_sends_batched_notifications_over_one_connection(self, monkeypatch):
+        provider = BatchEmailNotificationProvider(
+            self.provider.smpt, self.from_addr, self.to_addrs
+        )
+        connected: List[EmailNotificationProvider] = []
+        connect = EmailNotificationProvider._connect
+
+        def recording_connect(self):
+            connected.append(self)
+            return connect(self)
+
+        monkeypatch.setattr(EmailNotificationProvider, "_connect", recording_connect)
+
+        for _ in range(100):
+            provider.task_completed()
+        provider.flush()
+
+        assert len(connected) == 1
+        assert len(self.server.messages) == 100
+        sender = provider._sender
+        provider.close()
+        assert not sender.is_alive()
+        assert connected[0]._connection is None
+
+    def test_batched_notification_errors_are_raised_by_flush(self):
+        provider = BatchEmailNotificationProvider(
+            SmtpConfiguration(self.server.host, self.server.port, require_tls=True),
+            self.from_addr,
+            self.to_addrs,
+        )
+
+        provider.task_completed()
+        with pytest.raises(smtplib.SMTPNotSupportedError):
+            provider.flush()
+        provider.close()
+
     def test_sends_emails_in_parallel(self):
         manager = TaskManager(
             notification_provider=self.provider, notify_on_complete=True
@@ -5,12 +5,24 @@ Contains tests for parallel.py.
 import functools
 import multiprocessing
 import os
+import sys
+import threading
 import time
 from typing import List, Callable, TextIO
 
 import pytest
 
-from memento.parallel import TaskManager, delayed
+from memento.exceptions import AggregateException, RemoteTaskError
+from memento.notifications import DefaultNotificationProvider
+from memento.parallel import (
+    TaskManager,
+    delayed,
+    _fast_dumps,
+    _fast_loads,
+    TASK_PRIORITY_HIGH,
+    TASK_PRIORITY_MEDIUM,
+    TASK_PRIORITY_LOW,
+)
 
 BASE_PATH = os.path.abspath(os.path.dirname(__file__))
 INPUT_PATH = os.path.join(BASE_PATH, "data", "hello_world.txt")
@@ -36,12 +48,35 @@ class CallableDummyClass:
         return x + y
 
 
+class CountingNotificationProvider(DefaultNotificationProvider):
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.all_completed = 0
+
+    def task_completed(self):
+        self.completed += 1
+
+    def all_tasks_completed(self):
+        self.all_completed += 1
+
+    def task_failure(self):
+        self.failed += 1
+
+
 def recursive_function(x: int):
     if x <= 0:
         return 0
     return 1 + recursive_function(x - 1)
 
 
+def iterative_function(x: int):
+    total = 0
+    for _ in range(x):
+        total += 1
+    return total
+
+
 def function_with_dependencies(x: int, y: int):
     time.sleep(0)
     return x + y
@@ -61,6 +96,159 @@ def read_file(file: TextIO):
     return file.readlines()
 
 
+class UnpicklableError(Exception):
+    def __init__(self, code: int, reason: str):
+        super().__init__(f"{code}: {reason}")
+
+
+def raise_unpicklable_error():
+    raise UnpicklableError(1, "failed")
+
+
+class TestSerialization:
+    @pytest.mark.parametrize(
+        "obj,serializer",
+        [
+            ({"a": [1, 2]}, 0),
+            (DummyClass(1, 2), 0),
+            (lambda x: x + 1, 1),
+        ],
+    )
+    def test_fast_dumps_falls_back_to_cloudpickle(self, obj, serializer: int):
+        serialized = _fast_dumps(obj)
+        loaded = _fast_loads(serialized)
+
+        assert serialized[0] == serializer
+        if callable(obj):
+            assert loaded(1) == obj(1)
+        else:
+            assert loaded == obj
+
+    def test_fast_dumps_pickles_delayed_functions_by_reference(self):
+        task = delayed(function_with_dependencies)(1, 2)
+        serialized = _fast_dumps(task)
+
+        assert serialized[0] == 0
+        assert _fast_loads(serialized)() == 3
+        assert task.__name__ == "function_with_dependencies"
+
+    def test_fast_dumps_uses_cloudpickle_for_main_functions(self, monkeypatch):
+        def main_function():
+            return 1
+
+        monkeypatch.setattr(main_function, "__module__", "__main__")
+        monkeypatch.setattr(main_function, "__qualname__", "main_function")
+        monkeypatch.setattr(
+            sys.modules["__main__"], "main_function", main_function, raising=False
+        )
+
+        serialized = _fast_dumps(delayed(main_function)())
+
+        assert serialized[0] == 1
+        assert _fast_loads(serialized)() == 1
+
+
+class TestTaskManager:
+    def test_task_manager_notifies_from_parent_process(self):
+        notification_provider = CountingNotificationProvider()
+        manager = TaskManager(notification_provider=notification_provider)
+        manager.add_tasks(delayed(sum)([x]) for x in range(3))
+        manager.add_task(delayed(recursive_function)("not a number"))
+
+        with pytest.raises(AggregateException):
+            manager.run()
+
+        assert notification_provider.completed == 3
+        assert notification_provider.failed == 1
+
+    def test_task_manager_runs_in_process_with_one_worker(self):
+        notification_provider = CountingNotificationProvider()
+        manager = TaskManager(workers=1, notification_provider=notification_provider)
+        manager.add_task(delayed(os.getpid)())
+        manager.add_task(delayed(lambda x: x + 1)(1))
+
+        assert manager.run() == [os.getpid(), 2]
+        assert notification_provider.completed == 2
+
+    def test_task_manager_reuses_worker_processes(self):
+        with TaskManager(workers=2) as manager:
+            manager.add_tasks(delayed(os.getpid)() for _ in range(4))
+            first = set(manager.run())
+            manager.add_tasks(delayed(os.getpid)() for _ in range(4))
+            second = set(manager.run())
+
+            assert manager._pool is not None
+
+        assert len(first | second) <= 2
+        assert manager._pool is None
+
+    def test_task_manager_starts_only_needed_workers(self):
+        with TaskManager(workers=3) as manager:
+            manager.add_task(delayed(sum)([1]))
+            manager.run()
+            assert manager._pool_size == 1
+
+            manager.add_tasks(delayed(sum)([x]) for x in range(5))
+            assert manager.run() == list(range(5))
+            assert manager._pool_size == 3
+
+    def test_task_manager_without_tasks_starts_no_workers(self):
+        notification_provider = CountingNotificationProvider()
+        manager = TaskManager(
+            workers=2,
+            notification_provider=notification_provider,
+            notify_on_complete=True,
+        )
+
+        assert manager.run() == []
+        assert manager._pool is None
+        assert notification_provider.all_completed == 1
+
+    def test_task_returns_result_without_serializing_it(self):
+        manager = TaskManager()
+        manager.add_task(delayed(DummyClass)(1, 2))
+
+        assert manager._tasks[0].run() == DummyClass(1, 2)
+
+    def test_task_manager_reports_exceptions_that_cannot_be_unpickled(self):
+        manager = TaskManager(workers=2)
+        manager.add_task(delayed(raise_unpicklable_error)())
+
+        with pytest.raises(AggregateException) as exc_info:
+            manager.run()
+
+        (exception,) = exc_info.value.exceptions
+        assert isinstance(exception, RemoteTaskError)
+        assert exception.type_name == "UnpicklableError"
+        assert exception.message == "1: failed"
+        assert "raise_unpicklable_error" in exception.traceback
+
+    def test_task_manager_reports_results_that_cannot_be_serialized(self):
+        with TaskManager(workers=2) as manager:
+            manager.add_task(delayed(sum)([1]))
+            manager.add_task(delayed(threading.Lock)())
+
+            with pytest.raises(AggregateException) as exc_info:
+                manager.run()
+
+            (exception,) = exc_info.value.exceptions
+            assert isinstance(exception, TypeError)
+            assert manager._tasks == []
+
+
+@pytest.fixture(scope="module")
+def shared_manager():
+    """A task manager shared by tests, so its worker processes are only started once."""
+    with TaskManager() as manager:
+        yield manager
+
+
+@pytest.fixture
+def manager(shared_manager: TaskManager):
+    yield shared_manager
+    shared_manager.reset()
+
+
 @pytest.mark.slow
 class TestParallel:
     def test_parallel_uses_multiple_processes(self):
@@ -92,23 +280,23 @@ class TestParallel:
             (delayed(DummyClass(3, 3).calculate)(), [6]),
             (delayed(CallableDummyClass())(3, 4), [7]),
             (delayed(recursive_function)(8), [8]),
+            (delayed(iterative_function)(1000), [1000]),
             (delayed(function_with_dependencies)(4, 5), [9]),
             (delayed(function_referencing_locals)(5, 5), [10]),
             (delayed(function_with_local_import)(5, 6), [11]),
             (delayed(lambda x: list(x))(range(5)), [[0, 1, 2, 3, 4]]),
         ],
     )
-    def test_parallel_returns_correct_result(self, task: Callable, expected: List):
+    def test_parallel_returns_correct_result(
+        self, manager: TaskManager, task: Callable, expected: List
+    ):
         """The correct result is returned when tasks are run."""
-        manager = TaskManager()
         manager.add_task(task)
         results = manager.run()
 
         assert results == expected
 
-    def test_parallel_order(self):
-        manager = TaskManager()
-
+    def test_parallel_order(self, manager: TaskManager):
         def identity(x):
             return x
 
@@ -118,9 +306,17 @@ class TestParallel:
 
         assert results == list(range(10))
 
-    def test_parallel_with_file(self):
-        manager = TaskManager()
+    def test_parallel_runs_tasks_in_priority_order(self):
+        manager = TaskManager(workers=1)
+        manager.add_task(delayed(time.monotonic_ns)(), priority=TASK_PRIORITY_LOW)
+        manager.add_task(delayed(time.monotonic_ns)(), priority=TASK_PRIORITY_HIGH)
+        manager.add_task(delayed(time.monotonic_ns)(), priority=TASK_PRIORITY_MEDIUM)
+
+        low, high, medium = manager.run()
+
+        assert high < medium < low
 
+    def test_parallel_with_file(self, manager: TaskManager):
         with open(INPUT_PATH) as f:
             manager.add_task(delayed(read_file)(f))
 
@@ -1,10 +1,14 @@
-import time
+import hashlib
+import subprocess
+import sys
 from sqlite3 import Connection
 from unittest.mock import Mock
 import pytest
 import os
 import tempfile
 import cloudpickle
+import numpy as np
+from memento import task_interface
 from memento.task_interface import Context, FileSystemCheckpointing
 
 
@@ -61,9 +65,9 @@ class TestContext:
             assert x_values_1 == x_values_2
 
         def test_record_records_multiple_values_at_different_timestamps(self):
-            context = Context("key", FileSystemCheckpointing())
+            clock = iter([1.0, 2.0]).__next__
+            context = Context("key", FileSystemCheckpointing(), clock=clock)
             context.record({"name1": 1.0})
-            time.sleep(0.001)
             context.record({"name2": 2.0})
 
             metrics = context.collect_metrics()
@@ -98,6 +102,92 @@ class TestContext:
             assert expected_y_values == actual_y_values
             assert expected_x_values == actual_x_values
 
+        def test_record_uses_timestamp_for_values_after_a_tuple(self):
+            context = Context("key", FileSystemCheckpointing())
+            context.record({"name1": (1.0, 2.0), "name2": 3.0})
+
+            metrics = context.collect_metrics()
+
+            assert list(metrics["name1"]["x"]) == [1.0]
+            assert list(metrics["name2"]["x"]) != [1.0]
+
+        def test_record_rejects_values_that_are_not_numbers(self):
+            context = Context("key", FileSystemCheckpointing())
+            context.record({"name": 1.0})
+
+            with pytest.raises(TypeError):
+                context.record({"name": "not a number"})
+
+            metrics = context.collect_metrics()
+            assert list(metrics["name"]["y"]) == [1.0]
+            assert len(metrics["name"]["x"]) == 1
+
+        def test_flush_metrics_waits_for_batch_size(self):
+            checkpoint_provider = FileSystemCheckpointing()
+            context = Context("key", checkpoint_provider)
+            context.record({"name": (1.0, 2.0)})
+
+            context.flush_metrics(batch_size=2)
+
+            assert checkpoint_provider.get_metrics("key") == {}
+
+        def test_flush_metrics_keeps_flushed_values(self):
+            checkpoint_provider = FileSystemCheckpointing()
+            context = Context("key", checkpoint_provider)
+            context.record({"name1": (1.0, 2.0), "name2": (3.0, 4.0)})
+            context.flush_metrics(batch_size=2)
+            context.record({"name1": (5.0, 6.0), "name3": (7.0, 8.0)})
+
+            metrics = context.collect_metrics()
+
+            assert context._metrics.keys() == {"name1", "name3"}
+            assert list(metrics["name1"]["x"]) == [1.0, 5.0]
+            assert list(metrics["name1"]["y"]) == [2.0, 6.0]
+            assert list(metrics["name2"]["y"]) == [4.0]
+            assert list(metrics["name3"]["y"]) == [8.0]
+
+            checkpoint_provider.remove("key")
+            assert checkpoint_provider.get_metrics("key") == {}
+
+        def test_flush_metrics_replaces_values_of_failed_attempt(self):
+            checkpoint_provider = FileSystemCheckpointing()
+            failed = Context("key", checkpoint_provider)
+            failed.record({"name": (1.0, 2.0)})
+            failed.flush_metrics(batch_size=1)
+
+            retry = Context("key", checkpoint_provider)
+            retry.record({"name": (3.0, 4.0)})
+            retry.flush_metrics(batch_size=1)
+            retry.record({"name": (5.0, 6.0)})
+            retry.flush_metrics(batch_size=1)
+
+            metrics = retry.collect_metrics()
+
+            assert list(metrics["name"]["x"]) == [3.0, 5.0]
+            assert list(metrics["name"]["y"]) == [4.0, 6.0]
+
+        def test_collect_metrics_without_metrics_does_not_import_pandas(self):
+            code = (
+                "import sys\n"
+                "from memento.task_interface import Context, FileSystemCheckpointing\n"
+                "assert Context('key', FileSystemCheckpointing()).collect_metrics() == {}\n"
+                "assert 'pandas' not in sys.modules\n"
+            )
+
+            subprocess.run([sys.executable, "-c", code], check=True)
+
+        def test_record_records_after_metrics_are_collected(self):
+            context = Context("key", FileSystemCheckpointing())
+            context.record({"name": (1.0, 2.0)})
+            first = context.collect_metrics()
+
+            context.record({"name": (3.0, 4.0)})
+            second = context.collect_metrics()
+
+            assert list(first["name"]["y"]) == [2.0]
+            assert list(second["name"]["x"]) == [1.0, 3.0]
+            assert list(second["name"]["y"]) == [2.0, 4.0]
+
     class TestCheckpoint:
         def setup_method(self, method):
             file = tempfile.NamedTemporaryFile(
@@ -128,6 +218,142 @@ class TestContext:
 
             assert value == 1
 
+        def test_file_system_checkpoint_provider_restores_arrays(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+            context = Context("key", checkpoint_provider)
+            array = np.arange(12, dtype=np.float64).reshape(3, 4)
+
+            context.checkpoint({"scores": array})
+            value = context.restore()
+
+            assert np.array_equal(value["scores"], array)
+            assert value["scores"].flags.writeable
+
+        def test_file_system_checkpoint_provider_uses_wal(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+
+            with checkpoint_provider as database:
+                (journal_mode,) = database.execute("PRAGMA journal_mode").fetchone()
+
+            assert journal_mode == "wal"
+
+        def test_file_system_checkpoint_provider_reuses_connections(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+
+            with checkpoint_provider as first, checkpoint_provider._read() as read:
+                pass
+            with checkpoint_provider as second, checkpoint_provider._read() as read_again:
+                pass
+
+            assert first is second
+            assert read is read_again
+            assert read is not first
+
+        def test_file_system_checkpoint_provider_reopens_replaced_database(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+            checkpoint_provider.set("key", [1])
+
+            os.unlink(self._filepath)
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+
+            assert not checkpoint_provider.contains("key")
+            checkpoint_provider.set("key", [2])
+            assert checkpoint_provider.get("key") == 2
+
+        def test_file_system_checkpoint_provider_contains_does_not_load_item(
+            self, monkeypatch
+        ):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+            checkpoint_provider.set("key", (1,))
+            monkeypatch.setattr(
+                task_interface, "_loads_item", Mock(side_effect=AssertionError)
+            )
+
+            assert checkpoint_provider.contains("key")
+            assert not checkpoint_provider.contains("not_in_checkpoint")
+
+        def test_file_system_checkpoint_provider_stores_keys_as_bytes(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+            context = Context("key", checkpoint_provider)
+
+            context.checkpoint(1)
+
+            assert context.key == b"key"
+            assert checkpoint_provider.contains(b"key")
+            assert checkpoint_provider.contains("key")
+            with checkpoint_provider as database:
+                (key_type,) = database.execute(
+                    "SELECT typeof(key) FROM checkpoint_table"
+                ).fetchone()
+            assert key_type == "blob"
+
+        def test_file_system_checkpoint_provider_creates_temporary_file(self):
+            checkpoint_provider = FileSystemCheckpointing()
+            checkpoint_provider.set("key", (1,))
+
+            assert os.path.isabs(checkpoint_provider._filepath)
+            assert checkpoint_provider._filepath.endswith("_memento.checkpoint")
+            assert os.path.exists(checkpoint_provider._filepath)
+            assert FileSystemCheckpointing()._filepath != checkpoint_provider._filepath
+
+        def test_file_system_checkpoint_provider_finishes_open_transactions(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+            insert = "INSERT INTO checkpoint_table(key,value) VALUES(?,?)"
+
+            with checkpoint_provider as database:
+                database.execute("BEGIN")
+                database.execute(insert, (b"committed", b""))
+            with pytest.raises(ValueError):
+                with checkpoint_provider as database:
+                    database.execute("BEGIN")
+                    database.execute(insert, (b"rolled_back", b""))
+                    raise ValueError()
+
+            assert checkpoint_provider.contains("committed")
+            assert not checkpoint_provider.contains("rolled_back")
+
+        def test_file_system_checkpoint_provider_set_many_works(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+
+            checkpoint_provider.set_many({"key1": (1,), "key2": (2,)})
+
+            assert checkpoint_provider.get("key1") == 1
+            assert checkpoint_provider.get("key2") == 2
+
+        def test_file_system_checkpoint_provider_rolls_back_failed_writes(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+
+            with pytest.raises(ValueError):
+                with checkpoint_provider._write() as database:
+                    database.execute(
+                        "INSERT INTO checkpoint_table(key,value) VALUES(?,?)",
+                        ("key", b""),
+                    )
+                    raise ValueError()
+
+            assert not checkpoint_provider.contains("key")
+
+        def test_file_system_checkpoint_provider_remove_many_works(self):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+            for key in ("key1", "key2", "key3"):
+                checkpoint_provider.set(key, [key])
+
+            checkpoint_provider.remove_many(["key1", "key3", "not_in_checkpoint"])
+
+            assert not checkpoint_provider.contains("key1")
+            assert checkpoint_provider.contains("key2")
+            assert not checkpoint_provider.contains("key3")
+
+        def test_file_system_checkpoint_provider_remove_many_skips_empty_keys(
+            self, monkeypatch
+        ):
+            checkpoint_provider = FileSystemCheckpointing(filepath=self._filepath)
+            monkeypatch.setattr(
+                FileSystemCheckpointing, "__enter__", lambda _: pytest.fail()
+            )
+
+            checkpoint_provider.remove_many([])
+
         def test_file_system_checkpoint_provider_creates_correct_keys(self):
             def function(*args):
                 return args
@@ -141,13 +367,16 @@ class TestContext:
                 "key4": False,
                 "context_key": context_key,
             }
-            expected = cloudpickle.dumps(
-                {
-                    "function": function,
-                    "args": arguments,
-                    "kwargs": keyword_arguments,
-                }
-            )
+            fingerprint = hashlib.blake2b(
+                cloudpickle.dumps(function, protocol=5), digest_size=16
+            ).digest()
+            expected = hashlib.blake2b(
+                fingerprint
+                + cloudpickle.dumps(
+                    {"args": arguments, "kwargs": keyword_arguments}, protocol=5
+                ),
+                digest_size=16,
+            ).digest()
 
             connection = Mock(spec_set=Connection)
             checkpoint_provider = FileSystemCheckpointing(connection=connection)
@@ -161,7 +390,7 @@ class TestContext:
             self,
         ):
             connection = Mock(spec_set=Connection)
-            connection.execute().fetchall.return_value = None
+            connection.execute().fetchone.return_value = None
             checkpoint_provider = FileSystemCheckpointing(connection=connection)
 
             with pytest.raises(KeyError) as error_info: